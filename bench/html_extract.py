@@ -0,0 +1,81 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from oa import iter_homepage_candidates, iter_homepage_candidates_soup
+
+
+def synthetic_page(seed, sections=400):
+    rng = random.Random(seed)
+    parts = [
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">',
+        '<title>Example &amp; Co</title>',
+        '<link rel="stylesheet" href="/css/site.css">',
+        '<link rel="shortcut icon" href="/favicon.ico?v=2&amp;x=1">',
+        '<link REL="apple-touch-icon" sizes="180x180" href=\'/apple-touch-icon.png\'>',
+        '<meta property="og:image" content="https://cdn.example.com/og.jpg">',
+        '<meta name="twitter:image" content="https://cdn.example.com/tw.jpg">',
+        '<script>var s = "<img src=/logo-in-script.png>";</script>',
+        '<!-- <link rel="icon" href="/commented.png"> -->',
+        '</head><body>',
+        '<header><a href="/"><img class="logo" src="/img/brand-logo.svg" alt="Example logo"></a></header>',
+    ]
+    for i in range(sections):
+        parts.append(f'<div class="row r{i}"><p>{"lorem ipsum " * rng.randint(5, 40)}</p>')
+        if rng.random() < 0.3:
+            parts.append(f'<img src="/media/photo{i}.jpg" alt="photo {i}" data-src="/lazy/{i}.jpg">')
+        if rng.random() < 0.05:
+            parts.append(f'<img data-src="/assets/partner-logo-{i}.png" alt="Partner">')
+        parts.append('</div>')
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def load_fixtures(paths):
+    pages = []
+    for path in paths:
+        if os.path.isdir(path):
+            pages.extend(load_fixtures(sorted(os.path.join(path, f) for f in os.listdir(path))))
+        elif path.endswith(('.html', '.htm')):
+            with open(path, 'rb') as f:
+                pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def best_time(func, html, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list(func(html, 'https://www.example.com/'))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        pages = load_fixtures(sys.argv[1:])
+    else:
+        pages = [(f"synthetic_{i}.html", synthetic_page(i, sections=100 * (i + 1))) for i in range(4)]
+
+    if not pages:
+        print("No HTML fixtures found")
+        exit(1)
+
+    total_soup = total_fast = 0
+    for name, html in pages:
+        soup_candidates = list(iter_homepage_candidates_soup(html, 'https://www.example.com/'))
+        fast_candidates = list(iter_homepage_candidates(html, 'https://www.example.com/'))
+        match = "same" if soup_candidates == fast_candidates else "DIFFERENT"
+
+        soup_time = best_time(iter_homepage_candidates_soup, html, 5)
+        fast_time = best_time(iter_homepage_candidates, html, 5)
+        total_soup += soup_time
+        total_fast += fast_time
+        print(f"{name:30s} {len(html) / 1024:8.1f} KB  soup {soup_time * 1000:8.2f} ms  "
+              f"fast {fast_time * 1000:7.2f} ms  x{soup_time / fast_time:6.1f}  {match}")
+
+    print(f"\nTotal: soup {total_soup * 1000:.1f} ms, fast {total_fast * 1000:.1f} ms "
+          f"({total_soup / total_fast:.1f}x faster)")
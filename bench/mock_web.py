@@ -0,0 +1,273 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import oa
+
+
+PROVIDER_NAMES = ['google', 'faviconkit', 'clearbit', 'gstatic']
+
+
+def make_png(seed, size=32):
+    rng = random.Random(seed)
+    rows = b''.join(b'\x00' + bytes(rng.randrange(256) for _ in range(size * 3)) for _ in range(size))
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def site_profile(domain, config):
+    """Deterministic behaviour of one mock site, drawn from the configured mix."""
+    rng = random.Random(f"{config['seed']}:{domain}")
+    return {
+        'logo': rng.choice(['link', 'og', 'common', 'img', 'none']),
+        'redirect': rng.random() < config['redirect_rate'],
+        'large': rng.random() < config['large_rate'],
+        'slow': rng.random() < config['slow_rate'],
+        'error': rng.random() < config['error_rate'],
+    }
+
+
+class FarmHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None
+    logo = None
+    counter = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body=b'', content_type='text/html', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def delay(self, rng):
+        latency = rng.lognormvariate(0, self.config['latency_sigma']) * self.config['latency_ms'] / 1000
+        time.sleep(min(latency, 30))
+
+    def do_GET(self):
+        if self.path == '/__stats':
+            with self.counter['lock']:
+                body = json.dumps({'requests': self.counter['requests']}).encode()
+            return self.send_body(200, body, 'application/json')
+        with self.counter['lock']:
+            self.counter['requests'] += 1
+        self.delay(random.Random())
+        self.route()
+
+
+class ProviderHandler(FarmHandler):
+    name = None
+
+    def route(self):
+        domain = parse_qs(urlparse(self.path).query).get('domain', [''])[0]
+        rng = random.Random(f"{self.config['seed']}:{self.name}:{domain}")
+        if rng.random() < self.config['provider_hit_rate']:
+            return self.send_body(200, self.logo, 'image/png')
+        self.send_body(404, b'not found')
+
+
+class SiteHandler(FarmHandler):
+
+    def route(self):
+        domain = self.headers.get('Host', '')
+        profile = site_profile(domain, self.config)
+        path = urlparse(self.path).path
+        if profile['slow']:
+            time.sleep(self.config['slow_seconds'])
+        if path == '/':
+            if profile['error']:
+                return self.send_body(503, b'unavailable', headers={'Retry-After': '1'})
+            if profile['redirect']:
+                return self.send_body(301, b'', headers={'Location': '/home'})
+            return self.send_body(200, self.page(profile))
+        if path == '/home':
+            return self.send_body(200, self.page(profile))
+        assets = {
+            'link': '/static/icon.png',
+            'og': '/static/og.png',
+            'common': '/logo.png',
+            'img': '/img/site-logo.png',
+        }
+        if assets.get(profile['logo']) == path:
+            return self.send_body(200, self.logo, 'image/png')
+        self.send_body(404, b'<html><body>not found</body></html>')
+
+    def page(self, profile):
+        head = ['<html><head><title>Mock</title>']
+        if profile['logo'] == 'link':
+            head.append('<link rel="icon" href="/static/icon.png">')
+        if profile['logo'] == 'og':
+            head.append('<meta property="og:image" content="/static/og.png">')
+        head.append('</head><body>')
+        if profile['logo'] == 'img':
+            head.append('<header><img src="/img/site-logo.png" alt="Company logo"></header>')
+        body = '<div><p>' + 'lorem ipsum ' * 200 + '</p></div>'
+        if profile['large']:
+            body *= self.config['large_page_kb'] // 2
+        return (''.join(head) + body + '</body></html>').encode()
+
+
+def run_farm(config, ports_queue):
+    counter = {'requests': 0, 'lock': threading.Lock()}
+    logo = make_png(config['seed'], size=48)
+    ThreadingHTTPServer.request_queue_size = 2048
+    ThreadingHTTPServer.daemon_threads = True
+    servers = {}
+    for name in PROVIDER_NAMES:
+        handler = type(f"{name}Handler", (ProviderHandler,),
+                       {'config': config, 'logo': logo, 'counter': counter, 'name': name})
+        servers[name] = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    handler = type('Site', (SiteHandler,), {'config': config, 'logo': logo, 'counter': counter})
+    servers['site'] = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    for server in servers.values():
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ports_queue.put({name: server.server_address[1] for name, server in servers.items()})
+    threading.Event().wait()
+
+
+def install_mock_dns():
+    """Resolve *.test to loopback; dead-*.test fails like a missing domain."""
+    original = socket.getaddrinfo
+
+    def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        if isinstance(host, bytes):
+            host = host.decode()
+        if host and host.endswith('.test'):
+            if host.startswith('dead-'):
+                raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+            host = '127.0.0.1'
+        return original(host, port, family, type, proto, flags)
+
+    socket.getaddrinfo = getaddrinfo
+
+
+def instrument_hunters(timings):
+    sync_get_logo = oa.LogoHunter.try_get_logo
+    async_get_logo = oa.AsyncLogoHunter.try_get_logo
+
+    def timed(self, url):
+        started = time.perf_counter()
+        try:
+            return sync_get_logo(self, url)
+        finally:
+            timings.append(time.perf_counter() - started)
+
+    async def timed_async(self, url):
+        started = time.perf_counter()
+        try:
+            return await async_get_logo(self, url)
+        finally:
+            timings.append(time.perf_counter() - started)
+
+    oa.LogoHunter.try_get_logo = timed
+    oa.AsyncLogoHunter.try_get_logo = timed_async
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark oa.py against a local mock web")
+    parser.add_argument('--urls', type=int, default=500)
+    parser.add_argument('--backend', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--race', action='store_true', help="race favicon providers")
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--latency-sigma', type=float, default=0.8)
+    parser.add_argument('--provider-hit-rate', type=float, default=0.6)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--redirect-rate', type=float, default=0.2)
+    parser.add_argument('--large-rate', type=float, default=0.05)
+    parser.add_argument('--large-page-kb', type=int, default=3000)
+    parser.add_argument('--slow-rate', type=float, default=0.02)
+    parser.add_argument('--slow-seconds', type=float, default=6)
+    parser.add_argument('--dead-rate', type=float, default=0.05)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0,
+                        help="share of URLs that are a variant (trailing slash, fragment) of an earlier URL")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items()}
+    ports_queue = multiprocessing.Queue()
+    farm = multiprocessing.Process(target=run_farm, args=(config, ports_queue), daemon=True)
+    farm.start()
+    ports = ports_queue.get(timeout=30)
+
+    install_mock_dns()
+    oa.FAVICON_SERVICES[:] = [f"http://127.0.0.1:{ports[name]}/favicons?domain={{domain}}"
+                              for name in PROVIDER_NAMES]
+    oa.PROVIDER_HOSTS.clear()
+    oa.PROVIDER_HOSTS.update(f"127.0.0.1:{ports[name]}" for name in PROVIDER_NAMES)
+
+    rng = random.Random(args.seed)
+    urls = []
+    for i in range(args.urls):
+        if urls and rng.random() < args.duplicate_rate:
+            urls.append(rng.choice(urls).rstrip('/') + rng.choice(['/', '/#top']))
+            continue
+        prefix = 'dead-' if rng.random() < args.dead_rate else ''
+        urls.append(f"http://{prefix}site{i:06d}.test:{ports['site']}")
+
+    timings = []
+    instrument_hunters(timings)
+    workdir = tempfile.mkdtemp(prefix='oa_bench_')
+    hunter_options = {'race_providers': True} if args.race else None
+
+    started = time.perf_counter()
+    results, stats = oa.process_all_urls(
+        urls, max_workers=args.workers, backend=args.backend, max_concurrency=args.concurrency,
+        hunter_options=hunter_options,
+        journal_file=os.path.join(workdir, 'journal.sqlite'),
+        negative_cache_file=os.path.join(workdir, 'negative.sqlite'),
+        strategy_file=os.path.join(workdir, 'strategy.json'),
+        metrics_file=os.path.join(workdir, 'crawl_metrics.prom'))
+    elapsed = time.perf_counter() - started
+
+    with urlopen(f"http://127.0.0.1:{ports['site']}/__stats") as response:
+        requests_served = json.load(response)['requests']
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    farm.terminate()
+
+    print("\nBENCHMARK RESULTS")
+    print(f"  Backend:          {args.backend}" + (" (racing providers)" if args.race else ""))
+    print(f"  URLs:             {len(urls):,} in {elapsed:.1f}s ({len(urls) / elapsed:.1f} URLs/s)")
+    print(f"  Success:          {stats['success']:,} ({stats['success'] / max(stats['total'], 1) * 100:.1f}%)")
+    print(f"  Latency per URL:  p50 {percentile(timings, 50):.3f}s  p95 {percentile(timings, 95):.3f}s  "
+          f"p99 {percentile(timings, 99):.3f}s  max {max(timings, default=0):.3f}s")
+    print(f"  Requests per URL: {requests_served / len(urls):.2f}")
+    print(f"  Peak RSS:         {peak_rss_mb:.0f} MB")
+    print(f"  Methods:          {stats['methods']}")
+
+
+if __name__ == "__main__":
+    main()
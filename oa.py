@@ -2,52 +2,1105 @@
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit
 import time
 import os
+import sys
 from PIL import Image
 from io import BytesIO
 import hashlib
 import re
+import random
+import html as html_lib
 import json
 import pickle
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sqlite3
+import socket
+import ssl
+import threading
+import asyncio
+import urllib3
+from bisect import bisect_left
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
-print("\n Loading URLs from logos.snappy.parquet...")
 
-try:
-    df = pd.read_parquet('logos.snappy.parquet')
-    print(f"DataFrame shape: {df.shape}")
-    all_urls = []
-    for i in range(len(df)):
-        url = str(df.iloc[i, 0]).strip()
-        if url and url.lower() != 'nan' and url != 'None':
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
-            all_urls.append(url)
-        
-except Exception as e:
-    print(f" Error loading parquet: {e}")
-    exit(1)
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+FAVICON_SERVICES = [
+    "https://www.google.com/s2/favicons?domain={domain}&sz=256",
+    "https://api.faviconkit.com/{domain}/256",
+    "https://logo.clearbit.com/{domain}?size=256",
+    "https://t2.gstatic.com/faviconV2?client=SOCIAL&type=FAVICON&fallback_opts=TYPE,SIZE,URL&url=http://{domain}&size=256",
+]
+
+PROVIDER_HOSTS = {urlparse(template).netloc for template in FAVICON_SERVICES}
+
+COMMON_PATHS = [
+    '/logo.png', '/logo.svg', '/logo.jpg', '/logo.ico',
+    '/favicon.ico', '/favicon.png', '/apple-touch-icon.png',
+    '/images/logo.png', '/img/logo.png', '/static/logo.png',
+    '/assets/logo.png', '/media/logo.png',
+]
+
+DOMAIN_ROOT_PATHS = ['/favicon.ico', '/logo.ico', '/apple-touch-icon.png']
+
+LOGO_WORDS = ['logo', 'brand', 'header', 'navbar']
+
+
+PROVIDER_TIMEOUT = 5
+
+# md5 digests of generic icons that carry no brand information. BlobStore adds
+# digests flagged with mark_placeholder() on top of these.
+PLACEHOLDER_DIGESTS = {
+    '6ff1009e1215a17f2ac9420bed6a164d',  # WordPress default site icon
+}
+
+
+def logo_digest(content):
+    return hashlib.md5(content).hexdigest()
+
+
+def is_placeholder(content):
+    return logo_digest(content) in PLACEHOLDER_DIGESTS
+
+
+def favicon_service_urls(domain):
+    return [template.format(domain=domain) for template in FAVICON_SERVICES]
+
+
+def provider_timeout(url, provider_timeouts):
+    return provider_timeouts.get(urlparse(url).netloc, PROVIDER_TIMEOUT)
+
+
+def request_key(url):
+    """url with scheme and host lowercased, default port, userinfo and fragment dropped."""
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = parts.hostname or ''
+        port = parts.port
+    except ValueError:
+        return url
+    if ':' in host:
+        host = f"[{host}]"
+    if port is not None and port != {'http': 80, 'https': 443}.get(scheme):
+        host = f"{host}:{port}"
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+def classify_favicon_service(content):
+    if 100 < len(content) < 500000 and not is_placeholder(content):
+        try:
+            Image.open(BytesIO(content))
+            return "favicon_service"
+        except:
+            if b'<svg' in content[:200] or content[:4] == b'\x00\x00\x01\x00':
+                return "favicon_service_svg"
+    return None
+
+
+# Hard caps on how much of a response body is read, per request type.
+MAX_BYTES = {
+    'favicon': 500000,
+    'image': 2000000,
+    'html': 2000000,
+}
+HTML_BODY_PREFIX = 256 * 1024
+READ_CHUNK = 16 * 1024
+
+
+def sniff_image_type(head):
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if head[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] in (b'\x00\x00\x01\x00', b'\x00\x00\x02\x00'):
+        return 'ico'
+    if head[:2] == b'BM':
+        return 'bmp'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    if head[4:8] == b'ftyp':
+        return 'avif'
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<html' not in text):
+        return 'svg'
+    # SVGs opening with a comment or <!DOCTYPE svg ...>
+    if b'<svg' in text[:200] and b'<html' not in text[:200]:
+        return 'svg'
+    return None
+
+
+class BoundedBody:
+    """Accumulates a streamed body and decides when to stop reading.
+
+    Image bodies are sniffed on the first bytes and dropped if they are not an
+    image or grow past their cap. HTML bodies stop HTML_BODY_PREFIX bytes after
+    </head>, or at the cap, and keep what was read.
+    """
+
+    def __init__(self, kind, content_length=None):
+        self.kind = kind
+        self.limit = MAX_BYTES[kind]
+        self.buffer = bytearray()
+        self.rejected = kind != 'html' and content_length is not None and int(content_length) > self.limit
+        self.sniffed = kind == 'html'
+        self.head_found = False
+
+    def feed(self, chunk):
+        """Add a chunk; return False once no more bytes should be read."""
+        self.buffer += chunk
+        # Markup is only sniffed once the first 200 bytes are in, where an <svg tag may sit.
+        if not self.sniffed and len(self.buffer) >= (200 if self.buffer.lstrip()[:1] == b'<' else 16):
+            self.sniffed = True
+            if sniff_image_type(bytes(self.buffer[:512])) is None:
+                self.rejected = True
+                return False
+        if self.kind == 'html':
+            if not self.head_found:
+                start = max(0, len(self.buffer) - len(chunk) - 6)
+                head_end = bytes(self.buffer[start:]).lower().find(b'</head>')
+                if head_end != -1:
+                    self.head_found = True
+                    self.limit = min(self.limit, start + head_end + HTML_BODY_PREFIX)
+            if len(self.buffer) >= self.limit:
+                del self.buffer[self.limit:]
+                return False
+            return True
+        if len(self.buffer) > self.limit:
+            self.rejected = True
+            return False
+        return True
+
+    def content(self):
+        if self.rejected or (not self.sniffed and sniff_image_type(bytes(self.buffer)) is None):
+            return None
+        return bytes(self.buffer)
+
+
+_SKIPPED_HTML = re.compile(rb'<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>', re.S | re.I)
+_CANDIDATE_TAG = re.compile(rb'<(link|meta|img)\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.I)
+_TAG_ATTR = re.compile(rb'([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+
+
+def _decode_attr(value):
+    try:
+        text = value.decode('utf-8')
+    except UnicodeDecodeError:
+        text = value.decode('latin-1')
+    return html_lib.unescape(text)
+
+
+def _tag_attrs(raw):
+    attrs = {}
+    for match in _TAG_ATTR.finditer(raw):
+        name, dq, sq, bare = match.groups()
+        value = dq if dq is not None else sq if sq is not None else bare
+        attrs[name.decode('latin-1').lower()] = _decode_attr(value) if value is not None else ''
+    return attrs
+
+
+def iter_homepage_candidates(html, final_url):
+    """Yield (method, href, min_size) in the order try_get_logo probes them.
+
+    Single regex pass over link/meta/img tags, skipping comments, scripts and
+    styles; yields the same candidates as iter_homepage_candidates_soup without
+    building a DOM.
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    base_url = f"{urlparse(final_url).scheme}://{urlparse(final_url).netloc}"
+
+    icons, metas, img_candidates = [], [], []
+    for match in _CANDIDATE_TAG.finditer(_SKIPPED_HTML.sub(b'', html)):
+        tag = match.group(1).lower()
+        attrs = _tag_attrs(match.group(2))
+        if tag == b'link':
+            rel = attrs.get('rel', '').lower()
+            href = attrs.get('href')
+            if rel and href and any(icon in rel for icon in ['icon', 'shortcut', 'apple-touch']):
+                icons.append(href)
+        elif tag == b'meta':
+            prop = attrs.get('property', '').lower()
+            content_val = attrs.get('content', '')
+            if content_val and ('og:image' in prop or 'twitter:image' in prop):
+                metas.append(content_val)
+        else:
+            src = attrs.get('src') or attrs.get('data-src')
+            if src:
+                alt = attrs.get('alt', '').lower()
+                src_lower = src.lower()
+                if any(word in alt or word in src_lower for word in LOGO_WORDS):
+                    img_candidates.append(src)
+
+    for href in icons:
+        yield "html_favicon", href, 50
+    for content_val in metas:
+        yield "og_image", content_val, 1000
+    for path in COMMON_PATHS:
+        yield "common_path", f"{base_url}{path}", 100
+    for src in img_candidates[:5]:
+        yield "img_candidate", src, 100
+
+
+def iter_homepage_candidates_soup(html, final_url):
+    """BeautifulSoup reference implementation of iter_homepage_candidates."""
+    base_url = f"{urlparse(final_url).scheme}://{urlparse(final_url).netloc}"
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for link in soup.find_all('link', rel=lambda x: x and any(
+        icon in str(x).lower() for icon in ['icon', 'shortcut', 'apple-touch']
+    )):
+        href = link.get('href')
+        if href:
+            yield "html_favicon", href, 50
+
+    for meta in soup.find_all('meta'):
+        prop = meta.get('property', '').lower()
+        content_val = meta.get('content', '')
+        if content_val and ('og:image' in prop or 'twitter:image' in prop):
+            yield "og_image", content_val, 1000
+
+    for path in COMMON_PATHS:
+        yield "common_path", f"{base_url}{path}", 100
+
+    img_candidates = []
+    for img in soup.find_all('img'):
+        src = img.get('src') or img.get('data-src')
+        if src:
+            alt = (img.get('alt') or '').lower()
+            src_lower = src.lower()
+            if any(word in alt or word in src_lower for word in LOGO_WORDS):
+                img_candidates.append(src)
+
+    for src in img_candidates[:5]:
+        yield "img_candidate", src, 100
+
+
+# How long a domain stays in the negative cache, per failure class.
+NEGATIVE_TTL = {
+    'dns': 3 * 24 * 3600,
+    'tls': 3 * 24 * 3600,
+    'refused': 24 * 3600,
+    'timeout': 6 * 3600,
+}
+
+
+def classify_failure(exc):
+    """Map a network exception (requests or aiohttp) to a NEGATIVE_TTL class, or None.
+
+    Only signs of a dead origin count: read and total timeouts come from slow
+    but reachable hosts and are not classified, so they are never negative-cached.
+    """
+    seen = set()
+    stack = [exc]
+    while stack:
+        e = stack.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        name = type(e).__name__
+        if isinstance(e, socket.gaierror) or 'NameResolution' in name or 'DNSError' in name:
+            return 'dns'
+        if isinstance(e, ssl.SSLError) or 'SSL' in name or 'Certificate' in name:
+            return 'tls'
+        if isinstance(e, ConnectionRefusedError):
+            return 'refused'
+        if 'ConnectTimeout' in name or 'ConnectionTimeout' in name:
+            return 'timeout'
+        stack.extend([e.__cause__, e.__context__, getattr(e, 'reason', None), getattr(e, 'os_error', None)])
+        stack.extend(arg for arg in getattr(e, 'args', ()) if isinstance(arg, BaseException))
+    return None
+
+
+class NegativeCache:
+    """Persistent record of domains whose origin was unreachable, with a TTL per failure class.
+
+    A domain only lands here when every favicon provider missed and the homepage
+    request failed at the network level, so while the entry is fresh the whole
+    URL can be skipped.
+    """
+
+    def __init__(self, path='negative_cache.sqlite', ttl=None):
+        self.ttl = ttl or NEGATIVE_TTL
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS negative (
+                domain TEXT PRIMARY KEY,
+                failure TEXT,
+                expires REAL
+            )
+        """)
+        now = time.time()
+        self.conn.execute("DELETE FROM negative WHERE expires < ?", (now,))
+        self.conn.commit()
+        self.entries = {domain: (failure, expires) for domain, failure, expires
+                        in self.conn.execute("SELECT domain, failure, expires FROM negative")}
+
+    def lookup(self, domain):
+        entry = self.entries.get(domain)
+        if entry is None:
+            return None
+        failure, expires = entry
+        if expires < time.time():
+            return None
+        return failure
+
+    def add(self, domain, failure):
+        expires = time.time() + self.ttl.get(failure, 3600)
+        with self.lock:
+            self.entries[domain] = (failure, expires)
+            self.conn.execute("INSERT OR REPLACE INTO negative (domain, failure, expires) VALUES (?, ?, ?)",
+                              (domain, failure, expires))
+            self.conn.commit()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Per-thread seconds spent resolving (DnsCache) and connecting (install_connect_timer)
+# since the current request started; LogoHunter resets them for every request.
+NET_TIMINGS = threading.local()
+
+
+class CrawlMetrics:
+    """Latency histograms, counters and gauges for the crawler, exported while it runs.
+
+    observe() adds a duration to a histogram with LATENCY_BUCKETS, count() bumps
+    a counter, add_gauge()/set_gauge() track occupancy and gauge_callback()
+    registers a gauge read at snapshot time; every series is keyed by name and
+    labels. write() renders a snapshot as Prometheus text exposition, or as JSON
+    when the path ends in .json; start() rewrites it every interval seconds from
+    a background thread and stop() writes the final one. Error series keep at
+    most max_hosts distinct hosts, the rest are counted as host="other".
+    """
+
+    def __init__(self, max_hosts=1000):
+        self.max_hosts = max_hosts
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.callbacks = {}
+        self.hosts = set()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.path = None
+
+    @staticmethod
+    def target(host):
+        """Label of a request host: the favicon provider itself, or 'origin' for sites."""
+        return host if host in PROVIDER_HOSTS else 'origin'
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        bucket = bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+            series[0][bucket] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def observe_request(self, target, dns, connect, until_headers, pool_wait=0.0):
+        """Split the time until response headers into stages.
+
+        connect includes dns; both are 0 for a request on a reused connection
+        and are then left out of their histograms.
+        """
+        if pool_wait:
+            self.observe('crawl_request_stage_seconds', pool_wait, stage='pool_wait', target=target)
+        if connect:
+            self.observe('crawl_request_stage_seconds', dns, stage='dns', target=target)
+            self.observe('crawl_request_stage_seconds', connect - dns, stage='connect', target=target)
+        self.observe('crawl_request_stage_seconds', max(until_headers - connect - pool_wait, 0.0),
+                     stage='ttfb', target=target)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def error(self, host, failure):
+        with self.lock:
+            if host not in self.hosts:
+                if len(self.hosts) >= self.max_hosts:
+                    host = 'other'
+                else:
+                    self.hosts.add(host)
+        self.count('crawl_errors_total', host=host, error=failure)
+
+    def add_gauge(self, name, delta, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + delta
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def gauge_callback(self, name, func, **labels):
+        with self.lock:
+            self.callbacks[(name, tuple(sorted(labels.items())))] = func
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count)
+                          in self.histograms.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            callbacks = list(self.callbacks.items())
+        for key, func in callbacks:
+            try:
+                gauges[key] = func()
+            except Exception:
+                continue
+        return histograms, counters, gauges
+
+    def summary(self, name):
+        """(labels, count, total seconds) of every series of histogram name, largest total first."""
+        histograms = self.snapshot()[0]
+        rows = [(dict(labels), count, total) for (series, labels), (_, total, count) in histograms.items()
+                if series == name]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def render_prometheus(self):
+        histograms, counters, gauges = self.snapshot()
+
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                       for _, value in pairs)
+            return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+        lines = []
+        typed = set()
+        for kind, series in (('histogram', histograms), ('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in sorted(series.items(), key=lambda item: item[0]):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} {kind}")
+                if kind != 'histogram':
+                    lines.append(f"{name}{labels_text(labels)} {value}")
+                    continue
+                buckets, total, count = value
+                cumulative = 0
+                for bound, observed in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                    cumulative += observed
+                    lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{labels_text(labels)} {total:.6f}")
+                lines.append(f"{name}_count{labels_text(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def render_json(self):
+        histograms, counters, gauges = self.snapshot()
+        return json.dumps({
+            'timestamp': time.time(),
+            'buckets': list(LATENCY_BUCKETS),
+            'histograms': [{'name': name, 'labels': dict(labels), 'buckets': buckets, 'sum': total, 'count': count}
+                           for (name, labels), (buckets, total, count) in sorted(histograms.items())],
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(counters.items())],
+            'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in sorted(gauges.items())],
+        }, indent=1)
+
+    def write(self, path):
+        text = self.render_json() if path.endswith('.json') else self.render_prometheus()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    def start(self, path, interval=10):
+        def refresh():
+            while not self.stopping.wait(interval):
+                try:
+                    self.write(path)
+                except Exception as e:
+                    print(f"Could not write metrics to {path}: {e}")
+
+        self.path = path
+        self.stopping.clear()
+        self.thread = threading.Thread(target=refresh, name='crawl-metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        self.write(self.path)
+
+
+class DnsCache:
+    """Process-wide getaddrinfo cache shared by every worker thread and the aiohttp resolver.
+
+    install() wraps socket.getaddrinfo; lookups that fail are cached for
+    negative_ttl so a dead domain costs one resolver round-trip per run.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=60, max_entries=100000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.original = None
+
+    def install(self):
+        if self.original is None:
+            self.original = socket.getaddrinfo
+            socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        if self.original is not None:
+            socket.getaddrinfo = self.original
+            self.original = None
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            if isinstance(entry[1], Exception):
+                raise entry[1]
+            return list(entry[1])
+        started = time.perf_counter()
+        try:
+            result = self.original(host, port, family, type, proto, flags)
+            entry = (now + self.ttl, result)
+        except socket.gaierror as e:
+            entry = (now + self.negative_ttl, e)
+        NET_TIMINGS.dns = getattr(NET_TIMINGS, 'dns', 0.0) + time.perf_counter() - started
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries.clear()
+            self.entries[key] = entry
+        if isinstance(entry[1], Exception):
+            raise entry[1]
+        return list(entry[1])
+
+
+DNS_CACHE = DnsCache()
+
+
+def install_connect_timer():
+    """Add the time urllib3 spends opening connections (DNS, TCP, TLS) to NET_TIMINGS.connect.
+
+    Returns a function that puts the original connect methods back.
+    """
+    patched = []
+    for cls in (urllib3.connection.HTTPConnection, urllib3.connection.HTTPSConnection):
+        original = cls.__dict__['connect']
+        if getattr(original, 'timed', False):
+            continue
+
+        def connect(self, original=original):
+            started = time.perf_counter()
+            try:
+                return original(self)
+            finally:
+                NET_TIMINGS.connect = getattr(NET_TIMINGS, 'connect', 0.0) + time.perf_counter() - started
+
+        connect.timed = True
+        cls.connect = connect
+        patched.append((cls, original))
+
+    def uninstall():
+        for cls, original in patched:
+            cls.connect = original
+        patched.clear()
+
+    return uninstall
+
+
+def request_trace_config():
+    """aiohttp trace filling the trace_request_ctx dict of a request with dns, connect and pool_wait seconds."""
+    config = aiohttp.TraceConfig()
+
+    def stage(name, start_signal, end_signal):
+        async def start(session, context, params):
+            setattr(context, name, time.perf_counter())
+
+        async def end(session, context, params):
+            timings = context.trace_request_ctx
+            if timings is not None and hasattr(context, name):
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - getattr(context, name)
+
+        start_signal.append(start)
+        end_signal.append(end)
+
+    stage('dns', config.on_dns_resolvehost_start, config.on_dns_resolvehost_end)
+    stage('connect', config.on_connection_create_start, config.on_connection_create_end)
+    stage('pool_wait', config.on_connection_queued_start, config.on_connection_queued_end)
+    return config
+
+
+class RateLimiter:
+    """Token buckets keyed by host, shared by every worker of a hunter.
+
+    Favicon providers and origin hosts each get their own bucket, with providers
+    allowed a higher rate. Rates adapt AIMD-style: a 429/503 halves the bucket's
+    rate and honours Retry-After, every healthy response adds rate_step back up
+    to the ceiling. acquire() reserves a token and returns how long the caller
+    must wait, so the same limiter serves threads (time.sleep) and asyncio
+    (asyncio.sleep).
+    """
+
+    def __init__(self, host_rate=5.0, provider_rate=50.0, host_max_rate=20.0, provider_max_rate=200.0,
+                 min_rate=0.2, rate_step=0.5, max_buckets=10000):
+        self.host_rate = host_rate
+        self.provider_rate = provider_rate
+        self.host_max_rate = host_max_rate
+        self.provider_max_rate = provider_max_rate
+        self.min_rate = min_rate
+        self.rate_step = rate_step
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def _bucket(self, key, now):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self._prune(now)
+            rate = self.provider_rate if key in PROVIDER_HOSTS else self.host_rate
+            bucket = {'rate': rate, 'tokens': max(rate, 1.0), 'updated': now, 'blocked_until': 0.0}
+            self.buckets[key] = bucket
+        return bucket
+
+    def _prune(self, now):
+        for key in [k for k, b in self.buckets.items() if b['blocked_until'] < now and now - b['updated'] > 60]:
+            del self.buckets[key]
+
+    def acquire(self, key):
+        with self.lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            capacity = max(bucket['rate'], 1.0)
+            bucket['tokens'] = min(capacity, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+            bucket['tokens'] -= 1
+            delay = -bucket['tokens'] / bucket['rate'] if bucket['tokens'] < 0 else 0.0
+            return max(delay, bucket['blocked_until'] - now)
+
+    def record(self, key, status, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            if status in (429, 503):
+                bucket['rate'] = max(self.min_rate, bucket['rate'] / 2)
+                bucket['tokens'] = min(bucket['tokens'], 0.0)
+                wait_seconds = parse_retry_after(retry_after)
+                if wait_seconds:
+                    bucket['blocked_until'] = max(bucket['blocked_until'], now + min(wait_seconds, 300))
+            elif status < 400:
+                ceiling = self.provider_max_rate if key in PROVIDER_HOSTS else self.host_max_rate
+                bucket['rate'] = min(ceiling, bucket['rate'] + self.rate_step)
+
+
+class RequestCoalescer:
+    """Singleflight for hunter requests, shared by every worker of a hunter.
+
+    do(key, func) runs func() unless a call with the same key is already in
+    flight, in which case the caller waits for that call and gets its result
+    (or exception); do_async is the asyncio twin, where the shared request is
+    only cancelled once every waiter has gone. With remember=True the result is
+    also kept in an LRU of max_results entries and returned to later callers
+    without running func at all. A (logo bytes, method) result is kept as its
+    digest, with the bytes written to blobs and read back on reuse; without
+    blobs such results are shared in flight but not remembered. shared and
+    reused count the calls saved.
+    """
+
+    def __init__(self, max_results=10000, blobs=None):
+        self.max_results = max_results
+        self.blobs = blobs
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.tasks = {}
+        self.results = OrderedDict()
+        self.shared = 0
+        self.reused = 0
+
+    def recall(self, key):
+        with self.lock:
+            if key not in self.results:
+                return False, None
+            self.results.move_to_end(key)
+            digest, value = self.results[key]
+        if digest is not None:
+            logo_bytes = self.blobs.get(digest)
+            if logo_bytes is None:
+                return False, None
+            value = (logo_bytes,) + value
+        with self.lock:
+            self.reused += 1
+        return True, value
+
+    def remember(self, key, value):
+        digest = None
+        if isinstance(value, tuple) and value and isinstance(value[0], bytes):
+            if self.blobs is None:
+                return
+            digest, value = self.blobs.put(value[0]), value[1:]
+        with self.lock:
+            self.results[key] = (digest, value)
+            self.results.move_to_end(key)
+            if len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+
+    def do(self, key, func, remember=False):
+        if remember:
+            found, value = self.recall(key)
+            if found:
+                return value
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return call.result()
+        try:
+            value = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+        if remember:
+            self.remember(key, value)
+        call.set_result(value)
+        return value
+
+    async def do_async(self, key, func, remember=False):
+        if remember:
+            found, value = self.recall(key)
+            if found:
+                return value
+        call = self.tasks.get(key)
+        if call is None:
+            call = self.tasks[key] = [asyncio.ensure_future(func()), 0]
+            call[0].add_done_callback(lambda task: self.tasks.get(key) is call and self.tasks.pop(key))
+        else:
+            self.shared += 1
+        call[1] += 1
+        try:
+            value = await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                call[0].cancel()
+                if self.tasks.get(key) is call:
+                    del self.tasks[key]
+        if remember:
+            self.remember(key, value)
+        return value
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def strategy_key(method, href):
+    """Scheduler key for one probe: providers and fixed paths are tracked individually."""
+    if method == 'favicon_service':
+        return f"provider:{urlparse(href).netloc}"
+    if method in ('common_path', 'domain_root'):
+        return f"{method}:{urlparse(href).path}"
+    return method
+
+
+class StrategyScheduler:
+    """Learns how often each probe finds a logo and orders the fallback chain by it.
+
+    Outcomes are counted globally and per TLD. A TLD's rate is smoothed toward
+    the global rate (prior pseudo-trials), so sparse TLDs borrow global
+    evidence. Within each phase (providers, homepage candidates, domain root)
+    probes run in descending success rate, which minimises expected requests per
+    logo when every probe costs one request; ties keep the built-in order. Probes
+    below skip_below after min_trials are skipped except for an explore fraction
+    of domains, which keeps their statistics current. Counts persist in a JSON
+    file between runs.
+    """
+
+    def __init__(self, path='strategy_stats.json', min_trials=50, skip_below=0.01, explore=0.05, prior=20):
+        self.path = path
+        self.min_trials = min_trials
+        self.skip_below = skip_below
+        self.explore = explore
+        self.prior = prior
+        self.lock = threading.Lock()
+        self.stats = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except Exception as e:
+                print(f"Could not load strategy stats: {e}")
+
+    @staticmethod
+    def context(domain):
+        return 'tld:' + domain.split(':')[0].rsplit('.', 1)[-1].lower()
+
+    def _counts(self, context, key):
+        return self.stats.get(context, {}).get(key, [0, 0, 0.0])
+
+    def rate(self, domain, key):
+        trials, successes, _ = self._counts('global', key)
+        global_rate = (successes + 0.5 * self.prior) / (trials + self.prior)
+        trials, successes, _ = self._counts(self.context(domain), key)
+        return (successes + global_rate * self.prior) / (trials + self.prior)
+
+    def order(self, domain, items, key):
+        scored = []
+        for index, item in enumerate(items):
+            item_key = key(item)
+            rate = self.rate(domain, item_key)
+            if (self._counts('global', item_key)[0] >= self.min_trials and rate < self.skip_below
+                    and random.random() >= self.explore):
+                continue
+            scored.append((-rate, index, item))
+        scored.sort(key=lambda x: (x[0], x[1]))
+        return [item for _, _, item in scored]
+
+    def record(self, domain, key, success, elapsed):
+        with self.lock:
+            for context in ('global', self.context(domain)):
+                counts = self.stats.setdefault(context, {}).setdefault(key, [0, 0, 0.0])
+                counts[0] += 1
+                counts[1] += 1 if success else 0
+                counts[2] += elapsed
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = json.dumps(self.stats)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        rows = []
+        for key, (trials, successes, elapsed) in sorted(self.stats.get('global', {}).items()):
+            rows.append((key, trials, successes / trials if trials else 0.0, elapsed / trials if trials else 0.0))
+        return sorted(rows, key=lambda row: -row[2])
+
 
 class LogoHunter:
+    """Sequential fallback chain over favicon services, homepage HTML and common paths.
+
+    With race_providers=True the favicon services are raced instead of tried one
+    by one: the first provider starts immediately and another is added every
+    hedge_delay seconds (or as soon as one fails) until a valid image arrives.
+    hedge_delay=0 fires all providers at once. Raced requests run on a pool of
+    race_workers threads; a losing request cannot be interrupted and holds its
+    thread until it finishes or hits its provider timeout, so the pool needs a
+    thread for every worker racing every provider. provider_timeouts maps a
+    provider host to its latency budget in seconds. Every request first takes a token
+    from rate_limiter (a default RateLimiter unless one is passed in). Domains in
+    negative_cache are skipped until their entry expires. With a
+    strategy_scheduler, probes within each phase are reordered or skipped by
+    their learned success rate. Identical requests in flight at the same time
+    share one network call through coalescer, and the provider phase of a
+    domain and the homepage candidates of a redirect target (final_url) are
+    only worked out once: later URLs reuse the result. Request stage timings,
+    time per fallback strategy, HTML parse time and per-host errors go to
+    metrics (a CrawlMetrics).
+    """
     
-    def __init__(self):
+    def __init__(self, race_providers=False, hedge_delay=0.3, provider_timeouts=None, rate_limiter=None,
+                 negative_cache=None, strategy_scheduler=None, coalescer=None, metrics=None, race_workers=64):
         self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-        })
+        self.session.headers.update(DEFAULT_HEADERS)
         
-        self.request_count = 0
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.coalescer = coalescer or RequestCoalescer()
+        self.metrics = metrics or CrawlMetrics()
+        self.negative_cache = negative_cache
+        self.scheduler = strategy_scheduler
+        self.race_providers = race_providers
+        self.hedge_delay = hedge_delay
+        self.provider_timeouts = provider_timeouts or {}
+        self.race_workers = race_workers
+        self.race_pool = None
+
+    def _get(self, url, timeout, kind):
+        """Streamed GET returning (status, content, final_url); content is None if rejected."""
+        return self.coalescer.do((kind, request_key(url)), lambda: self._fetch(url, timeout, kind))
+
+    def _fetch(self, url, timeout, kind):
+        host = urlparse(url).netloc
+        target = self.metrics.target(host)
+        delay = self.rate_limiter.acquire(host)
+        if delay > 0:
+            self.metrics.observe('crawl_rate_limit_wait_seconds', delay, target=target)
+            time.sleep(delay)
+        NET_TIMINGS.dns = NET_TIMINGS.connect = 0.0
+        started = time.perf_counter()
+        self.metrics.add_gauge('crawl_requests_in_flight', 1)
+        try:
+            with self.session.get(url, timeout=timeout, allow_redirects=True, stream=True) as response:
+                headers = time.perf_counter()
+                self.metrics.observe_request(target, NET_TIMINGS.dns, NET_TIMINGS.connect, headers - started)
+                self.rate_limiter.record(host, response.status_code, response.headers.get('Retry-After'))
+                if response.status_code != 200:
+                    self.metrics.error(host, f"http_{response.status_code}")
+                    return response.status_code, None, response.url
+                body = BoundedBody(kind, response.headers.get('Content-Length'))
+                if not body.rejected:
+                    for chunk in response.iter_content(READ_CHUNK):
+                        if not body.feed(chunk):
+                            break
+                self.metrics.observe('crawl_request_stage_seconds', time.perf_counter() - headers,
+                                     stage='download', target=target)
+                return response.status_code, body.content(), response.url
+        except Exception as e:
+            self.metrics.error(host, classify_failure(e) or type(e).__name__)
+            raise
+        finally:
+            self.metrics.add_gauge('crawl_requests_in_flight', -1)
+
+    def _ordered(self, domain, candidates):
+        """candidates are (method, href, min_size) tuples."""
+        if self.scheduler is None:
+            return list(candidates)
+        return self.scheduler.order(domain, list(candidates), key=lambda c: strategy_key(c[0], c[1]))
+
+    def _record(self, domain, method, href, success, started):
+        if self.scheduler is not None:
+            self.scheduler.record(domain, strategy_key(method, href), success, time.monotonic() - started)
+
+    def _fetch_favicon_service(self, domain, favicon_url):
+        started = time.monotonic()
+        result = None
+        try:
+            status, content, _ = self._get(favicon_url, provider_timeout(favicon_url, self.provider_timeouts), 'favicon')
+            if content is not None:
+                method = classify_favicon_service(content)
+                if method:
+                    result = content, method
+        except:
+            pass
+        self._record(domain, 'favicon_service', favicon_url, result is not None, started)
+        return result
+
+    def _probe(self, domain, method, logo_url, min_size):
+        started = time.monotonic()
+        content = None
+        try:
+            status, content, _ = self._get(logo_url, 5, 'image')
+            if content is not None and (len(content) <= min_size or is_placeholder(content)):
+                content = None
+        except:
+            content = None
+        self._record(domain, method, logo_url, content is not None, started)
+        return content
+
+    def _race_favicon_services(self, domain):
+        if self.race_pool is None:
+            self.race_pool = ThreadPoolExecutor(max_workers=self.race_workers)
+        remaining = self._provider_urls(domain)
+        if not remaining:
+            return None
+        running = set()
+
+        def launch():
+            running.add(self.race_pool.submit(self._fetch_favicon_service, domain, remaining.pop(0)))
+
+        launch()
+        while remaining and self.hedge_delay <= 0:
+            launch()
+
+        while running:
+            done, running = wait(running, timeout=self.hedge_delay if remaining else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result:
+                    # Requests already on the wire finish in the pool and are dropped.
+                    for other in running:
+                        other.cancel()
+                    return result
+            if remaining:
+                launch()
+        return None
+
+    def _provider_urls(self, domain):
+        candidates = [('favicon_service', url, 100) for url in favicon_service_urls(domain)]
+        return [url for _, url, _ in self._ordered(domain, candidates)]
+
+    def _try_favicon_services(self, domain):
+        if self.race_providers:
+            return self._race_favicon_services(domain)
+        for favicon_url in self._provider_urls(domain):
+            result = self._fetch_favicon_service(domain, favicon_url)
+            if result:
+                return result
+        return None
+
+    def _try_homepage_candidates(self, domain, html, final_url):
+        candidates = []
+        with self.metrics.timer('crawl_html_parse_seconds'):
+            for method, href, min_size in iter_homepage_candidates(html, final_url):
+                try:
+                    candidates.append((method, urljoin(final_url, href), min_size))
+                except:
+                    continue
+        for method, logo_url, min_size in self._ordered(domain, candidates):
+            content = self._probe(domain, method, logo_url, min_size)
+            if content is not None:
+                return content, method
+        return None
         
     def try_get_logo(self, url):
-        self.request_count += 1
-        if self.request_count % 50 == 0:
-            time.sleep(1) 
-        
         try:
             parsed = urlparse(url)
             domain = parsed.netloc
@@ -55,127 +1108,40 @@ class LogoHunter:
             if not domain:
                 return None, "invalid_url"
             
-            favicon_urls = [
-                f"https://www.google.com/s2/favicons?domain={domain}&sz=256",
-                f"https://api.faviconkit.com/{domain}/256",
-                f"https://logo.clearbit.com/{domain}?size=256",
-                f"https://t2.gstatic.com/faviconV2?client=SOCIAL&type=FAVICON&fallback_opts=TYPE,SIZE,URL&url=http://{domain}&size=256",
-            ]
+            failure = self.negative_cache.lookup(domain) if self.negative_cache is not None else None
+            if failure:
+                return None, f"negative_cache: {failure}"
             
-            for favicon_url in favicon_urls:
-                try:
-                    response = self.session.get(favicon_url, timeout=5)
-                    if response.status_code == 200:
-                        content = response.content
-                        if 100 < len(content) < 500000:
-                            try:
-                                Image.open(BytesIO(content))
-                                return content, "favicon_service"
-                            except:
-                                if b'<svg' in content[:200] or content[:4] == b'\x00\x00\x01\x00':
-                                    return content, "favicon_service_svg"
-                except:
-                    continue
+            with self.metrics.timer('crawl_strategy_seconds', strategy='favicon_services'):
+                result = self.coalescer.do(('favicon_services', domain.lower()),
+                                           lambda: self._try_favicon_services(domain), remember=True)
+            if result:
+                return result
             
             try:
-                response = self.session.get(url, timeout=15, allow_redirects=True)
-                if response.status_code == 200:
-                    final_url = response.url
-                    base_url = f"{urlparse(final_url).scheme}://{urlparse(final_url).netloc}"
-                    
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    for link in soup.find_all('link', rel=lambda x: x and any(
-                        icon in str(x).lower() for icon in ['icon', 'shortcut', 'apple-touch']
-                    )):
-                        href = link.get('href')
-                        if href:
-                            try:
-                                logo_url = urljoin(final_url, href)
-                                resp = self.session.get(logo_url, timeout=5)
-                                if resp.status_code == 200:
-                                    content = resp.content
-                                    if len(content) > 50:
-                                        return content, "html_favicon"
-                            except:
-                                continue
-                    
-                    for meta in soup.find_all('meta'):
-                        prop = meta.get('property', '').lower()
-                        content_val = meta.get('content', '')
-                        if content_val and ('og:image' in prop or 'twitter:image' in prop):
-                            try:
-                                logo_url = urljoin(final_url, content_val)
-                                resp = self.session.get(logo_url, timeout=5)
-                                if resp.status_code == 200:
-                                    content = resp.content
-                                    if len(content) > 1000:
-                                        return content, "og_image"
-                            except:
-                                continue
-                    
-                    common_paths = [
-                        '/logo.png', '/logo.svg', '/logo.jpg', '/logo.ico',
-                        '/favicon.ico', '/favicon.png', '/apple-touch-icon.png',
-                        '/images/logo.png', '/img/logo.png', '/static/logo.png',
-                        '/assets/logo.png', '/media/logo.png',
-                    ]
-                    
-                    for path in common_paths:
-                        try:
-                            logo_url = f"{base_url}{path}"
-                            resp = self.session.get(logo_url, timeout=5)
-                            if resp.status_code == 200:
-                                content = resp.content
-                                if len(content) > 100:
-                                    return content, "common_path"
-                        except:
-                            continue
-                    
-                    img_candidates = []
-                    for img in soup.find_all('img'):
-                        src = img.get('src') or img.get('data-src')
-                        if src:
-                            alt = (img.get('alt') or '').lower()
-                            src_lower = src.lower()
-                            
-                            is_logo = False
-                            logo_words = ['logo', 'brand', 'header', 'navbar']
-                            for word in logo_words:
-                                if word in alt or word in src_lower:
-                                    is_logo = True
-                                    break
-                            
-                            if is_logo:
-                                img_candidates.append(src)
-                    
-                    for src in img_candidates[:5]:
-                        try:
-                            logo_url = urljoin(final_url, src)
-                            resp = self.session.get(logo_url, timeout=5)
-                            if resp.status_code == 200:
-                                content = resp.content
-                                if len(content) > 100:
-                                    return content, "img_candidate"
-                        except:
-                            continue
+                with self.metrics.timer('crawl_strategy_seconds', strategy='homepage'):
+                    status, html, final_url = self._get(url, 15, 'html')
+                if status == 200:
+                    with self.metrics.timer('crawl_strategy_seconds', strategy='homepage_candidates'):
+                        result = self.coalescer.do(('final_url', request_key(final_url)),
+                                                   lambda: self._try_homepage_candidates(domain, html, final_url),
+                                                   remember=True)
+                    if result:
+                        return result
                             
             except Exception as e:
+                failure = classify_failure(e)
+                if failure and self.negative_cache is not None:
+                    self.negative_cache.add(domain, failure)
                 return None, f"access_error: {str(e)[:30]}"
             
-            try:
-                base_domain = f"https://{domain}"
-                for path in ['/favicon.ico', '/logo.ico', '/apple-touch-icon.png']:
-                    try:
-                        logo_url = f"{base_domain}{path}"
-                        resp = self.session.get(logo_url, timeout=5)
-                        if resp.status_code == 200:
-                            content = resp.content
-                            if len(content) > 50:
-                                return content, "domain_root"
-                    except:
-                        continue
-            except:
-                pass
+            base_domain = f"https://{domain}"
+            candidates = [("domain_root", f"{base_domain}{path}", 50) for path in DOMAIN_ROOT_PATHS]
+            with self.metrics.timer('crawl_strategy_seconds', strategy='domain_root'):
+                for method, logo_url, min_size in self._ordered(domain, candidates):
+                    content = self._probe(domain, method, logo_url, min_size)
+                    if content is not None:
+                        return content, method
             
             return None, "not_found"
             
@@ -183,122 +1149,607 @@ class LogoHunter:
             return None, f"exception: {str(e)[:30]}"
 
 
-def process_all_urls(urls, max_workers=40):
-    
-    hunter = LogoHunter()
-    results = {}
-    stats = {
-        'total': 0,
-        'success': 0,
-        'failed': 0,
-        'methods': {},
-        'start_time': time.time()
-    }
-    
-    checkpoint_file = 'ultra_checkpoint.pkl'
-    
-    if os.path.exists(checkpoint_file):
-        print("Loading checkpoint...")
+class AsyncLogoHunter:
+    """asyncio twin of LogoHunter: same strategy chain, same (bytes, method) results.
+
+    A global semaphore caps in-flight requests; each origin host gets its own
+    smaller cap so thousands of concurrent URLs never pile onto one server.
+    Favicon providers serve every domain, so they get the larger provider cap.
+    race_providers, hedge_delay, provider_timeouts, rate_limiter, negative_cache,
+    strategy_scheduler, coalescer and metrics behave as in LogoHunter, except that
+    losing provider requests are cancelled outright. Request stages also include
+    pool_wait (aiohttp connector queue) and slot_wait (host/global caps).
+    """
+
+    def __init__(self, max_concurrency=500, max_per_host=4, max_per_provider=100,
+                 race_providers=False, hedge_delay=0.3, provider_timeouts=None, rate_limiter=None,
+                 negative_cache=None, strategy_scheduler=None, coalescer=None, metrics=None):
+        if aiohttp is None:
+            raise RuntimeError("The asyncio backend needs aiohttp (pip install aiohttp)")
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.max_per_provider = max_per_provider
+        self.race_providers = race_providers
+        self.hedge_delay = hedge_delay
+        self.provider_timeouts = provider_timeouts or {}
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.coalescer = coalescer or RequestCoalescer()
+        self.metrics = metrics or CrawlMetrics()
+        self.negative_cache = negative_cache
+        self.scheduler = strategy_scheduler
+        self.session = None
+        self.global_limit = None
+        self.host_limits = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(headers=DEFAULT_HEADERS, connector=connector,
+                                             trace_configs=[request_trace_config()])
+        self.global_limit = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _get(self, url, timeout, kind):
+        return await self.coalescer.do_async((kind, request_key(url)), lambda: self._fetch(url, timeout, kind))
+
+    async def _fetch(self, url, timeout, kind):
+        host = urlparse(url).netloc
+        limit = self.host_limits.get(host)
+        if limit is None:
+            size = self.max_per_provider if host in PROVIDER_HOSTS else self.max_per_host
+            limit = [asyncio.Semaphore(size), 0]
+            self.host_limits[host] = limit
+        limit[1] += 1
+        target = self.metrics.target(host)
+        try:
+            delay = self.rate_limiter.acquire(host)
+            if delay > 0:
+                self.metrics.observe('crawl_rate_limit_wait_seconds', delay, target=target)
+                await asyncio.sleep(delay)
+            queued = time.perf_counter()
+            async with limit[0], self.global_limit:
+                started = time.perf_counter()
+                self.metrics.observe('crawl_request_stage_seconds', started - queued, stage='slot_wait', target=target)
+                self.metrics.add_gauge('crawl_requests_in_flight', 1)
+                timings = {}
+                try:
+                    async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                                allow_redirects=True, trace_request_ctx=timings) as response:
+                        headers = time.perf_counter()
+                        self.metrics.observe_request(target, timings.get('dns', 0.0), timings.get('connect', 0.0),
+                                                     headers - started, timings.get('pool_wait', 0.0))
+                        self.rate_limiter.record(host, response.status, response.headers.get('Retry-After'))
+                        if response.status != 200:
+                            self.metrics.error(host, f"http_{response.status}")
+                            return response.status, None, str(response.url)
+                        body = BoundedBody(kind, response.headers.get('Content-Length'))
+                        if not body.rejected:
+                            async for chunk in response.content.iter_chunked(READ_CHUNK):
+                                if not body.feed(chunk):
+                                    break
+                        self.metrics.observe('crawl_request_stage_seconds', time.perf_counter() - headers,
+                                             stage='download', target=target)
+                        return response.status, body.content(), str(response.url)
+                except Exception as e:
+                    self.metrics.error(host, classify_failure(e) or type(e).__name__)
+                    raise
+                finally:
+                    self.metrics.add_gauge('crawl_requests_in_flight', -1)
+        finally:
+            limit[1] -= 1
+            if limit[1] == 0:
+                del self.host_limits[host]
+
+    _ordered = LogoHunter._ordered
+    _record = LogoHunter._record
+    _provider_urls = LogoHunter._provider_urls
+
+    async def _fetch_favicon_service(self, domain, favicon_url):
+        started = time.monotonic()
+        result = None
+        try:
+            status, content, _ = await self._get(favicon_url, provider_timeout(favicon_url, self.provider_timeouts),
+                                                 'favicon')
+            if content is not None:
+                method = classify_favicon_service(content)
+                if method:
+                    result = content, method
+        except Exception:
+            pass
+        self._record(domain, 'favicon_service', favicon_url, result is not None, started)
+        return result
+
+    async def _probe(self, domain, method, logo_url, min_size):
+        started = time.monotonic()
+        content = None
+        try:
+            status, content, _ = await self._get(logo_url, 5, 'image')
+            if content is not None and (len(content) <= min_size or is_placeholder(content)):
+                content = None
+        except Exception:
+            content = None
+        self._record(domain, method, logo_url, content is not None, started)
+        return content
+
+    async def _race_favicon_services(self, domain):
+        remaining = self._provider_urls(domain)
+        if not remaining:
+            return None
+        running = set()
+
+        def launch():
+            running.add(asyncio.ensure_future(self._fetch_favicon_service(domain, remaining.pop(0))))
+
+        launch()
+        while remaining and self.hedge_delay <= 0:
+            launch()
+
+        try:
+            while running:
+                done, running = await asyncio.wait(running, timeout=self.hedge_delay if remaining else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result:
+                        return result
+                if remaining:
+                    launch()
+            return None
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _try_favicon_services(self, domain):
+        if self.race_providers:
+            return await self._race_favicon_services(domain)
+        for favicon_url in self._provider_urls(domain):
+            result = await self._fetch_favicon_service(domain, favicon_url)
+            if result:
+                return result
+        return None
+
+    async def _try_homepage_candidates(self, domain, html, final_url):
+        candidates = []
+        with self.metrics.timer('crawl_html_parse_seconds'):
+            for method, href, min_size in iter_homepage_candidates(html, final_url):
+                try:
+                    candidates.append((method, urljoin(final_url, href), min_size))
+                except Exception:
+                    continue
+        for method, logo_url, min_size in self._ordered(domain, candidates):
+            content = await self._probe(domain, method, logo_url, min_size)
+            if content is not None:
+                return content, method
+        return None
+
+    async def try_get_logo(self, url):
         try:
-            with open(checkpoint_file, 'rb') as f:
-                checkpoint = pickle.load(f)
-                results = checkpoint.get('results', {})
-                stats = checkpoint.get('stats', stats)
-            print(f"Loaded {len(results):,} results from checkpoint")
+            parsed = urlparse(url)
+            domain = parsed.netloc
+
+            if not domain:
+                return None, "invalid_url"
+
+            failure = self.negative_cache.lookup(domain) if self.negative_cache is not None else None
+            if failure:
+                return None, f"negative_cache: {failure}"
+
+            with self.metrics.timer('crawl_strategy_seconds', strategy='favicon_services'):
+                result = await self.coalescer.do_async(('favicon_services', domain.lower()),
+                                                       lambda: self._try_favicon_services(domain), remember=True)
+            if result:
+                return result
+
+            try:
+                with self.metrics.timer('crawl_strategy_seconds', strategy='homepage'):
+                    status, html, final_url = await self._get(url, 15, 'html')
+                if status == 200:
+                    with self.metrics.timer('crawl_strategy_seconds', strategy='homepage_candidates'):
+                        result = await self.coalescer.do_async(
+                            ('final_url', request_key(final_url)),
+                            lambda: self._try_homepage_candidates(domain, html, final_url), remember=True)
+                    if result:
+                        return result
+
+            except Exception as e:
+                failure = classify_failure(e)
+                if failure and self.negative_cache is not None:
+                    self.negative_cache.add(domain, failure)
+                return None, f"access_error: {str(e)[:30]}"
+
+            base_domain = f"https://{domain}"
+            candidates = [("domain_root", f"{base_domain}{path}", 50) for path in DOMAIN_ROOT_PATHS]
+            with self.metrics.timer('crawl_strategy_seconds', strategy='domain_root'):
+                for method, logo_url, min_size in self._ordered(domain, candidates):
+                    content = await self._probe(domain, method, logo_url, min_size)
+                    if content is not None:
+                        return content, method
+
+            return None, "not_found"
+
         except Exception as e:
-            print(f"Could not load checkpoint: {e}")
-    
-    processed_urls = set(results.keys())
-    urls_to_process = [url for url in urls if url not in processed_urls]
-    
-    print(f"Already processed: {len(processed_urls):,}")
-    print(f"Remaining to process: {len(urls_to_process):,}")
-    
-    if not urls_to_process:
-        print("All URLs already processed!")
-        return results, stats
-    
-    batch_size = 200
-    total_batches = (len(urls_to_process) + batch_size - 1) // batch_size
-    
+            return None, f"exception: {str(e)[:30]}"
+
+
+class BlobStore:
+    """Content-addressed logo bytes, keyed by md5 digest and written once per digest.
+
+    Shares the journal's SQLite connection. Digests flagged as placeholders are
+    persisted here and merged into PLACEHOLDER_DIGESTS so the hunters treat them
+    as misses.
+    """
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER,
+                placeholder INTEGER DEFAULT 0,
+                bytes BLOB
+            )
+        """)
+        self.conn.commit()
+        PLACEHOLDER_DIGESTS.update(
+            row[0] for row in self.conn.execute("SELECT digest FROM blobs WHERE placeholder = 1"))
+
+    def put(self, logo_bytes, digest=None):
+        digest = digest or logo_digest(logo_bytes)
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO blobs (digest, size, bytes) VALUES (?, ?, ?)",
+                              (digest, len(logo_bytes), logo_bytes))
+            self.conn.commit()
+        return digest
+
+    def get(self, digest):
+        with self.lock:
+            row = self.conn.execute("SELECT bytes FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def mark_placeholder(self, digest):
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO blobs (digest, size) VALUES (?, 0)", (digest,))
+            self.conn.execute("UPDATE blobs SET placeholder = 1 WHERE digest = ?", (digest,))
+            self.conn.commit()
+        PLACEHOLDER_DIGESTS.add(digest)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM blobs WHERE bytes IS NOT NULL").fetchone()[0]
+
+
+class CrawlJournal:
+    """Append-only SQLite record of every processed URL.
+
+    Behaves like the old results dict (get, [], in, len, iteration) but rows are
+    written as each URL completes and logo bytes are only read back on access,
+    so resuming costs one key scan instead of unpickling the whole crawl. Rows
+    reference their logo by digest; the bytes live once in the BlobStore.
+    """
+
+    def __init__(self, path='crawl_journal.sqlite'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                url TEXT PRIMARY KEY,
+                method TEXT,
+                error TEXT,
+                size INTEGER,
+                md5 TEXT,
+                timestamp REAL,
+                digest TEXT
+            )
+        """)
+        self.conn.commit()
+        self.blobs = BlobStore(self.conn, self.lock)
+
+    def __setitem__(self, url, entry):
+        digest = entry.get('digest')
+        if entry.get('bytes') is not None:
+            digest = self.blobs.put(entry['bytes'], digest)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (url, method, error, size, md5, timestamp, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, entry.get('method'), entry.get('error'), entry.get('size'),
+                 entry.get('md5'), entry.get('timestamp'), digest))
+            self.conn.commit()
+
+    def __getitem__(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT method, error, size, md5, timestamp, digest FROM results WHERE url = ?",
+                (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        method, error, size, md5, timestamp, digest = row
+        if digest is None:
+            return {'bytes': None, 'method': method, 'error': error}
+        return {'bytes': self.blobs.get(digest), 'method': method, 'size': size, 'md5': md5,
+                'digest': digest, 'timestamp': timestamp}
+
+    def get(self, url, default=None):
+        try:
+            return self[url]
+        except KeyError:
+            return default
+
+    def __contains__(self, url):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM results WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def keys(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT url FROM results")}
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def update(self, entries):
+        for url, entry in entries.items():
+            self[url] = entry
+
+    def load_stats(self, stats, urls=None):
+        """Add the journal's results to stats, counting only urls when given."""
+        with self.lock:
+            if urls is None:
+                rows = self.conn.execute(
+                    "SELECT method, digest IS NOT NULL, COUNT(*) FROM results GROUP BY method, digest IS NOT NULL"
+                ).fetchall()
+            else:
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (url TEXT PRIMARY KEY)")
+                self.conn.execute("DELETE FROM wanted")
+                self.conn.executemany("INSERT OR IGNORE INTO wanted (url) VALUES (?)", ((url,) for url in urls))
+                rows = self.conn.execute(
+                    "SELECT method, digest IS NOT NULL, COUNT(*) FROM results JOIN wanted USING (url) "
+                    "GROUP BY method, digest IS NOT NULL"
+                ).fetchall()
+                self.conn.execute("DELETE FROM wanted")
+                self.conn.commit()
+        for method, success, count in rows:
+            stats['total'] += count
+            if success:
+                stats['success'] += count
+                stats['methods'][method] = stats['methods'].get(method, 0) + count
+            else:
+                stats['failed'] += count
+        return stats
+
+    def import_checkpoint(self, checkpoint_file):
+        with open(checkpoint_file, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self.update(checkpoint.get('results', {}))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def record_result(results, stats, url, logo_bytes, method):
+    stats['total'] += 1
+
+    if logo_bytes is not None:
+        stats['success'] += 1
+        stats['methods'][method] = stats['methods'].get(method, 0) + 1
+
+        digest = logo_digest(logo_bytes)
+
+        entry = {
+            'bytes': logo_bytes,
+            'method': method,
+            'size': len(logo_bytes),
+            'md5': digest[:16],
+            'digest': digest,
+            'timestamp': time.time()
+        }
+    else:
+        stats['failed'] += 1
+        entry = {
+            'bytes': None,
+            'method': method,
+            'error': 'No logo found'
+        }
+    results[url] = entry
+    return entry
+
+
+def print_progress(stats, done, total):
+    success_rate = (stats['success'] / stats['total'] * 100) if stats['total'] > 0 else 0
+
+    print(f" Progress: {done:,}/{total:,} "
+          f"| Success: {stats['success']:,} ({success_rate:.1f}%)")
+
+
+def process_urls_threaded(hunter, urls, results, stats, max_workers, batch_size=200, on_result=None):
+    total_batches = (len(urls) + batch_size - 1) // batch_size
+
     for batch_num in range(total_batches):
         batch_start = batch_num * batch_size
-        batch_end = min(batch_start + batch_size, len(urls_to_process))
-        batch = urls_to_process[batch_start:batch_end]
-        
+        batch_end = min(batch_start + batch_size, len(urls))
+        batch = urls[batch_start:batch_end]
+
         print(f"\nProcessing batch {batch_num + 1}/{total_batches} "
               f"({batch_start + 1:,}-{batch_end:,})")
-        
-        batch_results = {}
-        
+
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_to_url = {executor.submit(hunter.try_get_logo, url): url for url in batch}
-            
+
             completed = 0
+            hunter.metrics.set_gauge('crawl_urls_queued', len(batch))
             for future in as_completed(future_to_url):
                 url = future_to_url[future]
                 completed += 1
-                
+                hunter.metrics.set_gauge('crawl_urls_queued', len(batch) - completed)
+
                 try:
                     logo_bytes, method = future.result()
-                    stats['total'] += 1
-                    
-                    if logo_bytes is not None:
-                        stats['success'] += 1
-                        stats['methods'][method] = stats['methods'].get(method, 0) + 1
-                        
-                        md5_hash = hashlib.md5(logo_bytes).hexdigest()[:16]
-                        
-                        batch_results[url] = {
-                            'bytes': logo_bytes,
-                            'method': method,
-                            'size': len(logo_bytes),
-                            'md5': md5_hash,
-                            'timestamp': time.time()
-                        }
-                    else:
-                        stats['failed'] += 1
-                        batch_results[url] = {
-                            'bytes': None,
-                            'method': method,
-                            'error': 'No logo found'
-                        }
+                    entry = record_result(results, stats, url, logo_bytes, method)
                     if completed % 20 == 0 or completed == len(batch):
-                        elapsed = time.time() - stats['start_time']
-                        success_rate = (stats['success'] / stats['total'] * 100) if stats['total'] > 0 else 0
-                        
-                        print(f" Progress: {batch_start + completed:,}/{len(urls_to_process):,} "
-                              f"| Success: {stats['success']:,} ({success_rate:.1f}%)")
-                
+                        print_progress(stats, batch_start + completed, len(urls))
+
                 except Exception as e:
                     stats['total'] += 1
                     stats['failed'] += 1
-                    batch_results[url] = {
+                    entry = results[url] = {
                         'bytes': None,
                         'method': 'exception',
                         'error': str(e)[:100]
                     }
-        
-        results.update(batch_results)
-        
-        try:
-            with open(checkpoint_file, 'wb') as f:
-                pickle.dump({
-                    'results': results,
-                    'stats': stats,
-                    'processed_count': len(results)
-                }, f, protocol=pickle.HIGHEST_PROTOCOL)
-            print(f"  Checkpoint saved ({len(results):,} total results)")
-        except Exception as e:
-            print(f"  Could not save checkpoint: {e}")
-        
+                if on_result is not None:
+                    on_result(url, entry)
+
         if batch_num < total_batches - 1:
             time.sleep(2)
-    if os.path.exists(checkpoint_file):
+
+
+async def process_urls_async(urls, results, stats, max_concurrency=500, max_per_host=4,
+                             hunter_options=None, on_result=None):
+    """Continuous pipeline: a fixed pool of worker tasks drains one queue, no batch barriers."""
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+    completed = 0
+
+    async with AsyncLogoHunter(max_concurrency=max_concurrency, max_per_host=max_per_host,
+                               **(hunter_options or {})) as hunter:
+        hunter.metrics.gauge_callback('crawl_urls_queued', queue.qsize)
+        hunter.metrics.gauge_callback('crawl_requests_pending',
+                                      lambda: sum(limit[1] for limit in list(hunter.host_limits.values())))
+
+        async def worker():
+            nonlocal completed
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    logo_bytes, method = await hunter.try_get_logo(url)
+                    entry = record_result(results, stats, url, logo_bytes, method)
+                except Exception as e:
+                    stats['total'] += 1
+                    stats['failed'] += 1
+                    entry = results[url] = {
+                        'bytes': None,
+                        'method': 'exception',
+                        'error': str(e)[:100]
+                    }
+                if on_result is not None:
+                    # A blocking consumer only holds back this worker, not the event loop.
+                    await asyncio.to_thread(on_result, url, entry)
+                completed += 1
+                if completed % 20 == 0 or completed == len(urls):
+                    print_progress(stats, completed, len(urls))
+
+        await asyncio.gather(*(worker() for _ in range(min(max_concurrency, len(urls)))))
+
+    return results
+
+
+def process_all_urls(urls, max_workers=40, backend='threads', max_concurrency=500, max_per_host=4,
+                     hunter_options=None, journal_file='crawl_journal.sqlite',
+                     negative_cache_file='negative_cache.sqlite', strategy_file='strategy_stats.json',
+                     on_result=None, metrics_file='crawl_metrics.prom', metrics_interval=10):
+    """Crawl urls into the journal; on_result(url, entry) is called as each URL finishes.
+
+    Crawler metrics are rewritten to metrics_file every metrics_interval
+    seconds (Prometheus text, or JSON for a .json path; None disables it).
+    """
+    
+    stats = {
+        'total': 0,
+        'success': 0,
+        'failed': 0,
+        'methods': {},
+        'start_time': time.time()
+    }
+    
+    results = CrawlJournal(journal_file)
+    hunter_options = dict(hunter_options or {})
+    if negative_cache_file and 'negative_cache' not in hunter_options:
+        hunter_options['negative_cache'] = NegativeCache(negative_cache_file)
+    if strategy_file and 'strategy_scheduler' not in hunter_options:
+        hunter_options['strategy_scheduler'] = StrategyScheduler(strategy_file)
+    coalescer = hunter_options.setdefault('coalescer', RequestCoalescer(blobs=results.blobs))
+    metrics = hunter_options.setdefault('metrics', CrawlMetrics())
+    for state in ('total', 'success', 'failed'):
+        metrics.gauge_callback('crawl_urls', lambda state=state: stats[state], state=state)
+    metrics.gauge_callback('crawl_coalesced', lambda: coalescer.shared, kind='shared')
+    metrics.gauge_callback('crawl_coalesced', lambda: coalescer.reused, kind='reused')
+    metrics.gauge_callback('crawl_dns_cache_entries', lambda: len(DNS_CACHE.entries))
+    
+    checkpoint_file = 'ultra_checkpoint.pkl'
+    if os.path.exists(checkpoint_file) and len(results) == 0:
+        print("Importing legacy checkpoint into journal...")
         try:
+            results.import_checkpoint(checkpoint_file)
             os.remove(checkpoint_file)
-        except:
-            pass
+        except Exception as e:
+            print(f"Could not import checkpoint: {e}")
+    
+    processed_urls = results.keys()
+    results.load_stats(stats, urls)
+    if processed_urls:
+        print(f"Resuming from journal {journal_file}")
+    urls_to_process = [url for url in urls if url not in processed_urls]
+    
+    print(f"Already processed: {len(processed_urls):,}")
+    print(f"Remaining to process: {len(urls_to_process):,}")
+    
+    if not urls_to_process:
+        print("All URLs already processed!")
+        return results, stats
+    
+    scheduler = hunter_options.get('strategy_scheduler')
+    if metrics_file:
+        metrics.start(metrics_file, metrics_interval)
+    DNS_CACHE.install()
+    uninstall_connect_timer = install_connect_timer()
+    try:
+        if backend == 'asyncio':
+            asyncio.run(process_urls_async(urls_to_process, results, stats,
+                                           max_concurrency=max_concurrency, max_per_host=max_per_host,
+                                           hunter_options=hunter_options, on_result=on_result))
+        elif backend == 'threads':
+            hunter = LogoHunter(**{'race_workers': max_workers * len(FAVICON_SERVICES), **hunter_options})
+            process_urls_threaded(hunter, urls_to_process, results, stats, max_workers, on_result=on_result)
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+    finally:
+        if scheduler is not None:
+            scheduler.save()
+        metrics.stop()
+        uninstall_connect_timer()
+        DNS_CACHE.uninstall()
+    
+    if scheduler is not None:
+        print("\nStrategy success rates:")
+        for key, trials, rate, latency in scheduler.summary()[:10]:
+            print(f"  {key:30s} {rate * 100:5.1f}% of {trials:,} probes, {latency:.2f}s avg")
+    
+    print(f"\nRequest coalescing: {coalescer.shared:,} calls shared an in-flight request, "
+          f"{coalescer.reused:,} reused an earlier domain or redirect-target result")
+    
+    print("\nTime by fallback strategy:")
+    for labels, count, total in metrics.summary('crawl_strategy_seconds'):
+        print(f"  {labels['strategy']:20s} {total:9.1f}s over {count:,} URLs, {total / count:.2f}s avg")
+    print("Slowest request stages:")
+    for labels, count, total in metrics.summary('crawl_request_stage_seconds')[:10]:
+        print(f"  {labels['stage']:10s} {labels['target']:30s} {total:9.1f}s over {count:,} requests, "
+              f"{total / count * 1000:.0f}ms avg")
+    if metrics_file:
+        print(f"Metrics written to {metrics_file}")
     
     elapsed_total = time.time() - stats['start_time']
     print(f"\nProcessing completed in {elapsed_total/60:.1f} minutes")
@@ -306,105 +1757,218 @@ def process_all_urls(urls, max_workers=40):
     return results, stats
 
 
-def save_all_in_single_folder(results, urls, folder_name='Logos'):
-    print(f"\nSaving ALL logos to '{folder_name}' folder...")
+def load_urls(path='logos.snappy.parquet'):
+    print(f"\n Loading URLs from {path}...")
+
+    try:
+        df = pd.read_parquet(path)
+        print(f"DataFrame shape: {df.shape}")
+        all_urls = []
+        for i in range(len(df)):
+            url = str(df.iloc[i, 0]).strip()
+            if url and url.lower() != 'nan' and url != 'None':
+                if not url.startswith(('http://', 'https://')):
+                    url = 'https://' + url
+                all_urls.append(url)
+
+    except Exception as e:
+        print(f" Error loading parquet: {e}")
+        exit(1)
+
+    return all_urls
+
+
+def logo_extension(bytes_data):
+    """Extension used for a saved logo, from its header alone.
+
+    SVG documents that don't start with <svg keep the .png name they have
+    always been saved under, so oa2.py still picks them up.
+    """
+    kind = sniff_image_type(bytes_data[:512])
+    if kind == 'svg' and not bytes_data.startswith(b'<svg'):
+        return 'png'
+    return kind or 'png'
+
+
+def save_parquet_shards(results, urls, folder_name='LOGOS_PARQUET', shard_size=5000):
+    """Write one row per URL into Parquet shards instead of one file per logo.
+
+    Columns: index, url, domain, status, filename, method, error, digest, md5,
+    format, size, bytes. Failures are rows with status 'failed' and no bytes;
+    filename matches what save_all_in_single_folder would have written, so
+    oa2.py groups refer to the same names.
+    """
+    print(f"\nSaving ALL logos as Parquet shards in '{folder_name}'...")
     os.makedirs(folder_name, exist_ok=True)
+    for name in os.listdir(folder_name):
+        if name.startswith('part-') and name.endswith('.parquet'):
+            os.remove(os.path.join(folder_name, name))
     saved_count = 0
-    failed_count = 0
-
-    metadata = {
-        'total_urls': len(urls),
-        'processed_urls': len(results),
-        'saved_logos': 0,
-        'failed_logos': 0,
-        'success_rate': 0,
-        'processing_date': time.ctime(),
-        'files': []
-    }
-    
+    rows = []
+    shards = 0
+
+    def flush():
+        nonlocal rows, shards
+        if rows:
+            pd.DataFrame(rows).to_parquet(os.path.join(folder_name, f"part-{shards:05d}.parquet"),
+                                          index=False, compression='snappy')
+            shards += 1
+            rows = []
+
     for i, url in enumerate(urls, 1):
+        data = results.get(url, {'bytes': None, 'method': 'not_processed'})
+        bytes_data = data.get('bytes')
+        row = {
+            'index': i,
+            'url': url,
+            'domain': urlparse(url).netloc or url[:50],
+            'status': 'success' if bytes_data else 'failed',
+            'filename': None,
+            'method': data.get('method', 'unknown'),
+            'error': None if bytes_data else data.get('error', 'No logo found'),
+            'digest': None,
+            'md5': data.get('md5', ''),
+            'format': None,
+            'size': 0,
+            'bytes': None,
+        }
+        if bytes_data:
+            row['format'] = sniff_image_type(bytes_data[:512]) or 'unknown'
+            row['filename'] = f"{i:04d}.{logo_extension(bytes_data)}"
+            row['digest'] = data.get('digest') or logo_digest(bytes_data)
+            row['size'] = len(bytes_data)
+            row['bytes'] = bytes_data
+            saved_count += 1
+        rows.append(row)
+        if len(rows) >= shard_size:
+            flush()
+    flush()
+    print(f"Saved {saved_count:,} logos and {len(urls) - saved_count:,} failures in {shards} shards")
+    return saved_count
+
+
+def write_logo_file(filepath, bytes_data, original=None):
+    """Write one logo; original is the (path, future) of an earlier byte-identical logo to hard-link."""
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    if original is not None:
+        path, future = original
         try:
-            data = results.get(url, {'bytes': None, 'method': 'not_processed'})
-            file_number = f"{i:04d}"  
-            if data.get('bytes'):
-                bytes_data = data['bytes']
-                extension = 'png'  
+            future.result()
+            os.link(path, filepath)
+            return
+        except Exception:
+            pass
+    with open(filepath, 'wb') as f:
+        f.write(bytes_data)
+
+
+def write_failure_file(filepath, text):
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def save_all_in_single_folder(results, urls, folder_name='Logos', io_workers=16):
+    """Save every logo (and a _FAILED.txt per miss) on a bounded pool of I/O threads.
+
+    The extension comes from the file header (logo_extension), nothing is
+    decoded, and _METADATA.jsonl gets one line per file as soon as it is
+    written, between a 'run' line and a closing 'summary' line.
+    """
+    print(f"\nSaving ALL logos to '{folder_name}' folder...")
+    os.makedirs(folder_name, exist_ok=True)
+    counts = {'saved': 0, 'failed': 0}
+    written = {}
+    pending = {}
+    metadata_file = os.path.join(folder_name, '_METADATA.jsonl')
+
+    with open(metadata_file, 'w', encoding='utf-8') as metadata, \
+            ThreadPoolExecutor(max_workers=io_workers) as pool:
+
+        def log(entry):
+            metadata.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+        def drain():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = pending.pop(future)
                 try:
-                    img = Image.open(BytesIO(bytes_data))
-                    if img.format:
-                        extension = img.format.lower()
-                except:
-                    if bytes_data[:4] == b'<svg':
-                        extension = 'svg'
-                    elif bytes_data[:4] == b'\x00\x00\x01\x00':
-                        extension = 'ico'
-                    elif bytes_data[:8] == b'\x89PNG\r\n\x1a\n':
-                        extension = 'png'
-                    elif bytes_data[:3] == b'\xff\xd8\xff':
-                        extension = 'jpg'
-                    elif bytes_data[:4] == b'RIFF' and bytes_data[8:12] == b'WEBP':
-                        extension = 'webp'
-                
-                filename = f"{file_number}.{extension}"
-                filepath = os.path.join(folder_name, filename)
-                
-                with open(filepath, 'wb') as f:
-                    f.write(bytes_data)
-                
-                saved_count += 1
-                parsed = urlparse(url)
-                domain = parsed.netloc or url[:50]
-                
-                metadata['files'].append({
-                    'index': i,
-                    'filename': filename,
-                    'original_url': url,
-                    'domain': domain,
-                    'method': data.get('method', 'unknown'),
-                    'size': len(bytes_data),
-                    'md5': data.get('md5', ''),
-                    'status': 'success'
-                })
-                
-                if saved_count % 100 == 0:
-                    print(f"Saved {saved_count:,} logos...")
-                    
-            else:
-                filename = f"{file_number}_FAILED.txt"
-                filepath = os.path.join(folder_name, filename)
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(f"URL: {url}\n")
-                    f.write(f"Status: FAILED\n")
-                    f.write(f"Error: {data.get('error', 'No logo found')}\n")
-                    f.write(f"Method: {data.get('method', 'unknown')}\n")
-                    f.write(f"Index: {i}\n")
-                    f.write(f"Timestamp: {time.ctime()}\n")
-                
-                failed_count += 1
-                metadata['files'].append({
-                    'index': i,
-                    'filename': filename,
-                    'original_url': url,
-                    'status': 'failed',
-                    'error': data.get('error', 'No logo found'),
-                    'method': data.get('method', 'unknown')
-                })
-                
-        except Exception as e:
-            failed_count += 1
-            print(f" Error saving logo {i}: {str(e)[:50]}")
-    
-    metadata['saved_logos'] = saved_count
-    metadata['failed_logos'] = failed_count
-    metadata['success_rate'] = (saved_count / len(urls) * 100) if urls else 0
-    
-    metadata_file = os.path.join(folder_name, '_METADATA.json')
-    with open(metadata_file, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+                    future.result()
+                except Exception as e:
+                    counts['failed'] += 1
+                    print(f" Error saving logo {entry['index']}: {str(e)[:50]}")
+                    continue
+                if entry['status'] == 'success':
+                    counts['saved'] += 1
+                    if counts['saved'] % 100 == 0:
+                        print(f"Saved {counts['saved']:,} logos...")
+                else:
+                    counts['failed'] += 1
+                log(entry)
+
+        log({'type': 'run', 'total_urls': len(urls), 'processed_urls': len(results),
+             'processing_date': time.ctime()})
+        for i, url in enumerate(urls, 1):
+            try:
+                data = results.get(url, {'bytes': None, 'method': 'not_processed'})
+                file_number = f"{i:04d}"
+                if data.get('bytes'):
+                    bytes_data = data['bytes']
+                    filename = f"{file_number}.{logo_extension(bytes_data)}"
+                    filepath = os.path.join(folder_name, filename)
+                    digest = data.get('digest') or logo_digest(bytes_data)
+                    # Byte-identical logos share one copy on disk.
+                    original = written.get(digest)
+                    future = pool.submit(write_logo_file, filepath, bytes_data, original)
+                    if original is None:
+                        written[digest] = (filepath, future)
+                    entry = {
+                        'index': i,
+                        'filename': filename,
+                        'original_url': url,
+                        'domain': urlparse(url).netloc or url[:50],
+                        'method': data.get('method', 'unknown'),
+                        'size': len(bytes_data),
+                        'md5': data.get('md5', ''),
+                        'digest': digest,
+                        'status': 'success'
+                    }
+                else:
+                    filename = f"{file_number}_FAILED.txt"
+                    error = data.get('error', 'No logo found')
+                    text = (f"URL: {url}\n"
+                            f"Status: FAILED\n"
+                            f"Error: {error}\n"
+                            f"Method: {data.get('method', 'unknown')}\n"
+                            f"Index: {i}\n"
+                            f"Timestamp: {time.ctime()}\n")
+                    future = pool.submit(write_failure_file, os.path.join(folder_name, filename), text)
+                    entry = {
+                        'index': i,
+                        'filename': filename,
+                        'original_url': url,
+                        'status': 'failed',
+                        'error': error,
+                        'method': data.get('method', 'unknown')
+                    }
+                pending[future] = entry
+            except Exception as e:
+                counts['failed'] += 1
+                print(f" Error saving logo {i}: {str(e)[:50]}")
+            while len(pending) >= io_workers * 4:
+                drain()
+        while pending:
+            drain()
+
+        saved_count = counts['saved']
+        log({'type': 'summary', 'saved_logos': saved_count, 'failed_logos': counts['failed'],
+             'success_rate': (saved_count / len(urls) * 100) if urls else 0})
     
     return saved_count
 
 if __name__ == "__main__":
+    all_urls = load_urls()
+
     print(f"\nVERIFICATION:")
     print(f"   Total URLs loaded: {len(all_urls):,}")
     
@@ -415,4 +1979,7 @@ if __name__ == "__main__":
     total_attempts = stats['total']
     success_rate = (success_count / len(all_urls) * 100) if all_urls else 0
     
-    saved_count = save_all_in_single_folder(all_results, all_urls, 'LOGOS')
\ No newline at end of file
+    if '--parquet' in sys.argv[1:]:
+        saved_count = save_parquet_shards(all_results, all_urls, 'LOGOS_PARQUET')
+    else:
+        saved_count = save_all_in_single_folder(all_results, all_urls, 'LOGOS')
\ No newline at end of file
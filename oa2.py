@@ -1,28 +1,578 @@
 import os
+import sys
 import numpy as np
+import pandas as pd
 from PIL import Image, ImageChops, ImageStat, ImageFilter
 import imagehash
 import hashlib
 import json
 import time
+import threading
 import warnings
 import re
-from collections import defaultdict
+import signal
+import sqlite3
+import tempfile
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from contextlib import contextmanager
 from io import BytesIO
 
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
+
+_cairosvg_warned = False
+
 warnings.filterwarnings('ignore')
 
+SIGNATURE_VERSION = 3
+CONTENT_TYPES = {'svg', 'png', 'jpeg'}
+WORKING_SIZE = (64, 64)
+THUMBNAIL_BYTES = WORKING_SIZE[0] * WORKING_SIZE[1] * 3
+SVG_RENDER_SIZE = 256
+# Sampled recall below which the indexed engine warns that it is missing similar pairs
+MIN_INDEX_RECALL = 0.95
+
+
+def popcount64(values):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def allocate_column(folder, name, shape, dtype):
+    if folder is None:
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(os.path.join(folder, f"{name}.npy"), mode='w+', dtype=dtype, shape=shape)
+
+
+class SignatureMatrix:
+    """Columnar copy of a signature list for vectorized compare_signatures.
+
+    similarity(i, js) returns the same float64 scores as calling
+    compare_signatures(signatures[i], signatures[j]) for each j: the terms are
+    combined in the same order with the same weights, so greedy thresholding
+    gives identical groups.
+
+    Rows are integer ids in input order (42 bytes each), so signatures can be
+    streamed in without keeping the dicts; pass size when signatures is an
+    iterator. With folder set the columns are .npy memmaps in that folder.
+    """
+
+    COLUMNS = (
+        ('phash', np.uint64, ()),
+        ('ahash', np.uint64, ()),
+        ('color', np.uint8, (3,)),
+        ('brightness', np.float64, ()),
+        ('aspect', np.float64, ()),
+        ('type_code', np.int16, ()),
+        ('hash_code', np.int32, ()),
+        ('phash_valid', np.bool_, ()),
+    )
+
+    def __init__(self, signatures, size=None, folder=None):
+        n = len(signatures) if size is None else size
+        for name, dtype, shape in self.COLUMNS:
+            setattr(self, name, allocate_column(folder, name, (n,) + shape, dtype))
+        self.hash_code[:] = -1
+        self.type_codes = {}
+        self.hash_codes = {}
+        for i, sig in enumerate(signatures):
+            self.set_row(i, sig)
+
+    def set_row(self, i, sig):
+        try:
+            self.phash[i] = int(sig['phash'], 16)
+        except (TypeError, ValueError):
+            self.phash[i] = 0
+        try:
+            self.ahash[i] = int(sig['ahash'], 16)
+        except (TypeError, ValueError):
+            self.ahash[i] = 0
+        self.color[i] = sig['avg_color']
+        self.brightness[i] = sig['brightness']
+        self.aspect[i] = sig['aspect_ratio']
+        self.type_code[i] = self.type_codes.setdefault(sig['real_type'], len(self.type_codes))
+        if sig['hash'] != 'error':
+            self.hash_code[i] = self.hash_codes.setdefault(sig['hash'], len(self.hash_codes))
+        self.phash_valid[i] = self.phash[i] != 0
+
+    def resize(self, size):
+        """Grow or shrink the in-memory columns to size rows, keeping existing rows."""
+        for name, dtype, shape in self.COLUMNS:
+            column = getattr(self, name)
+            resized = np.full((size,) + shape, -1 if name == 'hash_code' else 0, dtype=dtype)
+            keep = min(size, len(column))
+            resized[:keep] = column[:keep]
+            setattr(self, name, resized)
+
+    def __len__(self):
+        return len(self.phash)
+
+    def take(self, indices, folder=None, chunk=65536):
+        subset = object.__new__(SignatureMatrix)
+        for name, dtype, shape in self.COLUMNS:
+            column = getattr(self, name)
+            if folder is None:
+                setattr(subset, name, column[indices])
+                continue
+            target = allocate_column(folder, name, (len(indices),) + shape, dtype)
+            for start in range(0, len(indices), chunk):
+                target[start:start + chunk] = column[indices[start:start + chunk]]
+            setattr(subset, name, target)
+        return subset
+
+    def similarity(self, i, js):
+        """Scores of row(s) i against rows js; a column of rows i gives a len(i) x len(js) block."""
+        hash_diff = popcount64(self.phash[js] ^ self.phash[i]).astype(np.float64)
+        hash_sim = np.maximum(0, 1 - (hash_diff / 64))
+        has_phash = self.phash_valid[js] & self.phash_valid[i]
+
+        color_dist = np.sqrt(((self.color[js].astype(np.float64) - self.color[i]) ** 2).sum(axis=-1))
+        color_sim = np.maximum(0, 1 - (color_dist / 441.67))
+        bright_sim = np.maximum(0, 1 - (np.abs(self.brightness[i] - self.brightness[js]) / 255))
+        ar_sim = np.maximum(0, 1 - np.abs(self.aspect[i] - self.aspect[js]))
+        same_type = self.type_code[js] == self.type_code[i]
+
+        total = np.zeros(hash_sim.shape)
+        weight = np.zeros(hash_sim.shape)
+        total = np.where(has_phash, total + hash_sim * 0.4, total)
+        weight = np.where(has_phash, weight + 0.4, weight)
+        total = total + color_sim * 0.3
+        weight = weight + 0.3
+        total = total + bright_sim * 0.1
+        weight = weight + 0.1
+        total = total + ar_sim * 0.1
+        weight = weight + 0.1
+        total = np.where(same_type, total + 0.8 * 0.1, total)
+        weight = np.where(same_type, weight + 0.1, weight)
+
+        similarity = total / weight
+        same_file = (self.hash_code[js] == self.hash_code[i]) & (self.hash_code[i] >= 0)
+        return np.where(same_file, 1.0, similarity)
+
+
+class HashIndex:
+    """Multi-index hashing over 64-bit hashes for sub-quadratic candidate pairs.
+
+    Each hash is split into `bands` equal bit bands. Two hashes within Hamming
+    distance `radius` differ in at most radius // bands bits in at least one
+    band (pigeonhole), so probing every band value within that sub-radius finds
+    all such pairs; band matches further apart than `radius` are dropped.
+    """
+
+    def __init__(self, hashes, radius=8, bands=4):
+        if 64 % bands:
+            raise ValueError("bands must divide 64")
+        self.radius = radius
+        self.bands = bands
+        bits = 64 // bands
+        sub_radius = radius // bands
+        masks = [sum(1 << b for b in flipped)
+                 for r in range(min(sub_radius, bits) + 1)
+                 for flipped in combinations(range(bits), r)]
+        n = len(hashes)
+        codes = []
+        for band in range(bands):
+            values = ((hashes >> np.uint64(band * bits)) & np.uint64((1 << bits) - 1)).astype(np.int64)
+            order = np.argsort(values, kind='stable')
+            sorted_values = values[order]
+            if bits <= 24:
+                bucket_sizes = np.bincount(values, minlength=1 << bits)
+                bucket_starts = np.cumsum(bucket_sizes) - bucket_sizes
+            for mask in masks:
+                query = values ^ mask
+                if bits <= 24:
+                    lo = bucket_starts[query]
+                    counts = bucket_sizes[query]
+                else:
+                    lo = np.searchsorted(sorted_values, query, 'left')
+                    counts = np.searchsorted(sorted_values, query, 'right') - lo
+                total = int(counts.sum())
+                if not total:
+                    continue
+                left = np.repeat(np.arange(n), counts)
+                offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                right = order[np.repeat(lo, counts) + offsets]
+                keep = left < right
+                left, right = left[keep], right[keep]
+                keep = popcount64(hashes[left] ^ hashes[right]) <= radius
+                codes.append(left[keep] * n + right[keep])
+        codes = np.unique(np.concatenate(codes)) if codes else np.zeros(0, dtype=np.int64)
+        self.pairs = np.stack([codes // n, codes % n], axis=1)
+        source = np.concatenate([self.pairs[:, 0], self.pairs[:, 1]])
+        target = np.concatenate([self.pairs[:, 1], self.pairs[:, 0]])
+        order = np.lexsort((target, source))
+        self.targets = target[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=n))])
+
+    def neighbors(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+
+class CandidateIndex:
+    """Union of pHash and aHash HashIndex neighbours for a SignatureMatrix.
+
+    Logos without a perceptual hash are scored on colour and shape alone, so
+    they stay candidates of every logo.
+    """
+
+    def __init__(self, matrix, radius=8, bands=4):
+        self.size = len(matrix)
+        self.indexes = [HashIndex(matrix.phash, radius, bands), HashIndex(matrix.ahash, radius, bands)]
+        self.wildcards = np.flatnonzero(~matrix.phash_valid)
+        self.wildcard_set = set(self.wildcards.tolist())
+
+    def neighbors(self, i):
+        if i in self.wildcard_set:
+            return np.delete(np.arange(self.size), i)
+        found = [index.neighbors(i) for index in self.indexes] + [self.wildcards[self.wildcards != i]]
+        return np.unique(np.concatenate(found))
+
+    def pair_count(self):
+        return sum(len(index.pairs) for index in self.indexes)
+
+    def recall(self, matrix, threshold=0.7, sample=200, seed=0):
+        """Share of pairs scoring >= threshold that the index proposes, on sampled logos."""
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(self.size, size=min(sample, self.size), replace=False)
+        expected = found = 0
+        for i in rows:
+            others = np.delete(np.arange(self.size), i)
+            matches = others[matrix.similarity(i, others) >= threshold]
+            expected += len(matches)
+            found += int(np.isin(matches, self.neighbors(i)).sum())
+        return found / expected if expected else 1.0
+
+
+class SignatureStore:
+    """Signatures persisted by file content hash and SIGNATURE_VERSION.
+
+    Only content-derived fields are stored; filename, extension and the
+    extension-based parts of real_type/is_svg_like are filled in per file, so
+    byte-identical logos under different names share one entry.
+    """
+
+    FIELDS = ('real_type', 'size', 'aspect_ratio', 'phash', 'ahash', 'avg_color', 'brightness', 'contrast')
+
+    def __init__(self, path='signature_cache.sqlite', version=SIGNATURE_VERSION):
+        self.version = version
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                digest TEXT,
+                version INTEGER,
+                signature TEXT,
+                PRIMARY KEY (digest, version)
+            )
+        """)
+        self.conn.commit()
+
+    def get_many(self, digests):
+        found = {}
+        digests = list(digests)
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT digest, signature FROM signatures WHERE version = ? AND digest IN ({','.join('?' * len(chunk))})",
+                [self.version] + chunk)
+            for digest, signature in rows:
+                signature = json.loads(signature)
+                signature['size'] = tuple(signature['size'])
+                signature['avg_color'] = tuple(signature['avg_color'])
+                found[digest] = signature
+        return found
+
+    @classmethod
+    def content_fields(cls, sig):
+        stored = {field: sig[field] for field in cls.FIELDS}
+        stored['avg_color'] = tuple(int(c) for c in sig['avg_color'])
+        if stored['real_type'] not in CONTENT_TYPES:
+            stored['real_type'] = None
+        return stored
+
+    def put_many(self, signatures):
+        rows = [(sig['hash'], self.version, json.dumps(self.content_fields(sig))) for sig in signatures]
+        self.conn.executemany("INSERT OR REPLACE INTO signatures (digest, version, signature) VALUES (?, ?, ?)", rows)
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM signatures WHERE version = ?", (self.version,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetLogos:
+    """Logos saved by oa.py save_parquet_shards, read without a file per logo.
+
+    Only the small columns are loaded up front; digests come from the shard,
+    and logo bytes are read one shard at a time when a file has to be decoded.
+    """
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            self.shards = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.parquet'))
+        else:
+            self.shards = [path]
+        self.locations = {}
+        self.digests = {}
+        for shard_id, shard in enumerate(self.shards):
+            frame = pd.read_parquet(shard, columns=['status', 'filename', 'digest'])
+            for row, (status, filename, digest) in enumerate(frame.itertuples(index=False)):
+                if status == 'success':
+                    self.locations[filename] = (shard_id, row)
+                    self.digests[filename] = digest
+        self.loaded_shard = None
+        self.loaded_bytes = None
+
+    @staticmethod
+    def is_source(path):
+        if os.path.isdir(path):
+            return any(name.endswith('.parquet') for name in os.listdir(path))
+        return path.endswith('.parquet')
+
+    def filenames(self):
+        return list(self.locations)
+
+    def read(self, filename):
+        shard_id, row = self.locations[filename]
+        if shard_id != self.loaded_shard:
+            self.loaded_bytes = pd.read_parquet(self.shards[shard_id], columns=['bytes'])['bytes'].tolist()
+            self.loaded_shard = shard_id
+        return self.loaded_bytes[row]
+
+
+class ThumbnailStore:
+    """Normalized WORKING_SIZE RGB thumbnails, decoded once per content hash.
+
+    Thumbnails are appended to a single uint8 array file (read back as a
+    memmap) and indexed in SQLite by (md5, version). Files that could not be
+    decoded in time are indexed with row -1.
+    """
+
+    def __init__(self, folder='thumbnails', version=SIGNATURE_VERSION):
+        os.makedirs(folder, exist_ok=True)
+        self.version = version
+        self.path = os.path.join(folder, 'thumbnails.u8')
+        open(self.path, 'ab').close()
+        self.conn = sqlite3.connect(os.path.join(folder, 'index.sqlite'))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                digest TEXT,
+                version INTEGER,
+                row INTEGER,
+                width INTEGER,
+                height INTEGER,
+                real_type TEXT,
+                PRIMARY KEY (digest, version)
+            )
+        """)
+        self.conn.commit()
+        self.rows = os.path.getsize(self.path) // THUMBNAIL_BYTES
+        self.array = None
+
+    def get_many(self, digests):
+        found = {}
+        digests = list(digests)
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT digest, row, width, height, real_type FROM thumbnails "
+                f"WHERE version = ? AND digest IN ({','.join('?' * len(chunk))})",
+                [self.version] + chunk)
+            for digest, row, width, height, real_type in rows:
+                found[digest] = (row, (width, height), real_type)
+        return found
+
+    def put_many(self, entries):
+        """Store (digest, thumbnail or None, size, real_type) entries; returns them as get_many would."""
+        stored = {}
+        with open(self.path, 'r+b') as f:
+            f.seek(self.rows * THUMBNAIL_BYTES)
+            for digest, thumbnail, size, real_type in entries:
+                row = -1
+                if thumbnail is not None:
+                    f.write(np.ascontiguousarray(thumbnail, dtype=np.uint8).tobytes())
+                    row = self.rows
+                    self.rows += 1
+                stored[digest] = (row, tuple(size), real_type if real_type in CONTENT_TYPES else None)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO thumbnails (digest, version, row, width, height, real_type) VALUES (?, ?, ?, ?, ?, ?)",
+            [(digest, self.version, row, size[0], size[1], real_type)
+             for digest, (row, size, real_type) in stored.items()])
+        self.conn.commit()
+        self.array = None
+        return stored
+
+    def view(self):
+        if self.array is None and self.rows:
+            self.array = np.memmap(self.path, dtype=np.uint8, mode='r',
+                                   shape=(self.rows,) + WORKING_SIZE[::-1] + (3,))
+        return self.array
+
+    def __len__(self):
+        return self.rows
+
+    def close(self):
+        self.conn.close()
+
+
+class ThumbnailTimeout(BaseException):
+    # BaseException so the decoders' broad "except Exception" fallbacks don't swallow it
+    pass
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raise ThumbnailTimeout in the block after seconds.
+
+    Uses SIGALRM, so it only applies on the main thread of a process (as in
+    the signature worker processes); elsewhere the block runs unbounded.
+    """
+    if not seconds or not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise ThumbnailTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def warn_missing_cairosvg():
+    global _cairosvg_warned
+    if cairosvg is None and not _cairosvg_warned:
+        _cairosvg_warned = True
+        print("cairosvg is not installed: SVG logos are approximated by their fill colour")
+
+
+_worker_cluster = None
+
+
+def _init_signature_worker(logos_folder, thumbnail_timeout=None):
+    global _worker_cluster, _cairosvg_warned
+    _cairosvg_warned = True
+    _worker_cluster = LogoCluster(logos_folder, signature_cache=None, thumbnail_cache=None,
+                                  thumbnail_timeout=thumbnail_timeout)
+
+
+def _signature_worker(filename):
+    signature = _worker_cluster.get_image_signature(filename)
+    signature['avg_color'] = tuple(int(c) for c in signature['avg_color'])
+    return signature
+
+
+def _thumbnail_worker(filename):
+    return _worker_cluster.file_thumbnail(filename)
+
+
+def _buffer_thumbnail_worker(filename, data, digest):
+    return _worker_cluster.buffer_thumbnail(filename, data, digest)
+
+
+def _bytes_signature_worker(filename, data, digest):
+    signature = _worker_cluster.signature_from_bytes(filename, data, digest)
+    signature['avg_color'] = tuple(int(c) for c in signature['avg_color'])
+    return signature
+
+
+class OnlineClusterer:
+    """Groups signatures as they arrive, for the streaming pipeline.
+
+    A logo whose md5 was seen before joins that copy's group; otherwise it
+    joins the group whose representative (first logo) scores highest, if that
+    score is at least 0.7, or becomes the representative of a new group -
+    the same rule as LogoCluster.update_groups.
+    """
+
+    def __init__(self, cluster=None, capacity=1024):
+        self.cluster = cluster or LogoCluster(None, signature_cache=None, thumbnail_cache=None)
+        self.matrix = SignatureMatrix([], size=capacity)
+        self.size = 0
+        self.filenames = []
+        self.members = []
+        self.representatives = []
+        self.group_of_hash = {}
+
+    def __len__(self):
+        return self.size
+
+    def add(self, signature):
+        row = self.size
+        if row == len(self.matrix):
+            self.matrix.resize(2 * row)
+        self.matrix.set_row(row, signature)
+        self.size += 1
+        self.filenames.append(signature['filename'])
+        code = int(self.matrix.hash_code[row])
+        group = self.group_of_hash.get(code) if code >= 0 else None
+        if group is None and self.representatives:
+            similarities = self.matrix.similarity(row, np.array(self.representatives))
+            best = int(np.argmax(similarities))
+            if similarities[best] >= 0.7:
+                group = best
+        if group is None:
+            group = len(self.members)
+            self.members.append([])
+            self.representatives.append(row)
+        self.members[group].append(row)
+        if code >= 0:
+            self.group_of_hash.setdefault(code, group)
+        return group
+
+    def groups(self):
+        """Current groups in the logo_gorups.json format, exact groups first."""
+        matrix = self.matrix.take(np.arange(self.size))
+        exact_groups = []
+        other_groups = []
+        for rows in self.members:
+            group = {'type': 'unique', 'files': [self.filenames[r] for r in rows], 'count': len(rows),
+                     'avg_similarity': 1.0}
+            self.cluster.describe_group(group, matrix, rows)
+            (exact_groups if group['type'] == 'exact' else other_groups).append(group)
+        return exact_groups + other_groups
+
 
 class LogoCluster:
-    def __init__(self, logos_folder="LOGOS"):
+    def __init__(self, logos_folder="LOGOS", engine="vectorized", hash_radius=8, hash_bands=4, workers=None,
+                 signature_cache="signature_cache.sqlite", block_size=1024, work_dir=None,
+                 thumbnail_cache="thumbnails", thumbnail_timeout=10):
         self.logos_folder = logos_folder
-        self.cache = {}
+        self.source = ParquetLogos(logos_folder) if logos_folder and ParquetLogos.is_source(logos_folder) else None
+        self.thumbnail_store = ThumbnailStore(thumbnail_cache) if thumbnail_cache else None
+        self.thumbnail_timeout = thumbnail_timeout
+        self.block_size = block_size
+        self.work_dir = work_dir
+        self.signature_store = SignatureStore(signature_cache) if signature_cache else None
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.hash_radius = hash_radius
+        self.hash_bands = hash_bands
+        self.cache = OrderedDict()
+        self.cache_size = 100000
+        warn_missing_cairosvg()
         
     def load_all_images(self):
         print("Loading all images...")   
         image_files = []
-        image_extensions = {'.png', '.jpg', '.jpeg', '.webp', '.ico'}
-        for file in os.listdir(self.logos_folder):
+        image_extensions = {'.png', '.jpg', '.jpeg', '.webp', '.ico', '.svg'}
+        names = self.source.filenames() if self.source else os.listdir(self.logos_folder)
+        for file in names:
             ext = os.path.splitext(file)[1].lower()
             if ext in image_extensions:
                 image_files.append(file)
@@ -32,39 +582,67 @@ class LogoCluster:
     def detect_file_type(self, filepath):
         try:
             with open(filepath, 'rb') as f:
-                header = f.read(512).decode('utf-8', errors='ignore')
-                if '<?xml' in header or '<svg' in header or 'svg' in header.lower():
-                    return 'svg'
-                f.seek(0)
-                png_signature = f.read(8)
-                if png_signature == b'\x89PNG\r\n\x1a\n':
-                    return 'png'
-                f.seek(0)
-                jpeg_signature = f.read(3)
-                if jpeg_signature == b'\xff\xd8\xff':
-                    return 'jpeg'
-                ext = os.path.splitext(filepath)[1].lower()
-                return ext[1:] if ext else 'unknown'
-                
+                return self.detect_buffer_type(f.read(512), filepath)
         except:
             return 'unknown'
+
+    def detect_buffer_type(self, data, filepath):
+        header = data[:512].decode('utf-8', errors='ignore')
+        if '<?xml' in header or '<svg' in header or 'svg' in header.lower():
+            return 'svg'
+        if data[:8] == b'\x89PNG\r\n\x1a\n':
+            return 'png'
+        if data[:3] == b'\xff\xd8\xff':
+            return 'jpeg'
+        ext = os.path.splitext(filepath)[1].lower()
+        return ext[1:] if ext else 'unknown'
     
     def load_image(self, filepath):
         try:
-            real_type = self.detect_file_type(filepath)
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            return self.load_image_buffer(data, self.detect_buffer_type(data, filepath), filepath)
+        except Exception as e:
+            print(f"Error loading {os.path.basename(filepath)}: {e}")
+            return Image.new('RGB', (64, 64), color=(200, 200, 200))
+
+    def load_image_buffer(self, data, real_type, filepath):
+        try:
             if real_type == 'svg':
-                return self.load_svg_file(filepath)
-            else:
-                return Image.open(filepath)
+                return self.load_svg_content(data.decode('utf-8', errors='ignore'), filepath)
+            return Image.open(BytesIO(data))
                 
         except Exception as e:
             print(f"Error loading {os.path.basename(filepath)}: {e}")
             return Image.new('RGB', (64, 64), color=(200, 200, 200))
+
+    def working_image(self, img):
+        """Downscale img to WORKING_SIZE, decoding as little as the format allows.
+
+        JPEGs are decoded in draft mode at the smallest DCT scale that still
+        covers WORKING_SIZE, ICOs use their smallest frame at least that large,
+        and big bitmaps are box-reduced before the final LANCZOS pass.
+        """
+        if img.format == 'JPEG':
+            img.draft(img.mode, WORKING_SIZE)
+        elif img.format == 'ICO':
+            sizes = sorted(img.info.get('sizes', ()), key=lambda s: s[0] * s[1])
+            large_enough = [s for s in sizes if s[0] >= WORKING_SIZE[0] and s[1] >= WORKING_SIZE[1]]
+            if large_enough:
+                img.size = large_enough[0]
+        return img.resize(WORKING_SIZE, Image.Resampling.LANCZOS, reducing_gap=3.0)
     
     def load_svg_file(self, filepath):
         try:
             with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
                 content = f.read()
+        except Exception as e:
+            print(f"Error processing SVG {os.path.basename(filepath)}: {e}")
+            return Image.new('RGB', (64, 64), color=(150, 150, 150))
+        return self.load_svg_content(content, filepath)
+
+    def load_svg_content(self, content, filepath):
+        try:
             width = 64
             height = 64
             width_match = re.search(r'width=["\']([^"\']+)["\']', content)
@@ -88,6 +666,10 @@ class LogoCluster:
                         height = int(float(parts[3]))
                 except:
                     pass
+            if cairosvg is not None:
+                img = self.rasterize_svg(content, width, height)
+                if img is not None:
+                    return img
             color = self.extract_svg_color(content)
             img = Image.new('RGB', (width, height), color=color)
             return img
@@ -96,6 +678,24 @@ class LogoCluster:
             print(f"Error processing SVG {os.path.basename(filepath)}: {e}")
             return Image.new('RGB', (64, 64), color=(150, 150, 150))
     
+    def rasterize_svg(self, content, width, height):
+        """Render an SVG on white, at most SVG_RENDER_SIZE on its longer side.
+
+        The declared size is kept in info['svg_size'] so signatures still
+        report the SVG's own dimensions.
+        """
+        scale = min(1.0, SVG_RENDER_SIZE / max(width, height, 1))
+        try:
+            png = cairosvg.svg2png(bytestring=content.encode('utf-8'),
+                                   output_width=max(1, int(width * scale)),
+                                   output_height=max(1, int(height * scale)),
+                                   background_color='white')
+            img = Image.open(BytesIO(png)).convert('RGB')
+        except Exception:
+            return None
+        img.info['svg_size'] = (width, height)
+        return img
+
     def extract_svg_color(self, svg_content):
         try:
             color_matches = re.findall(r'fill[:=]["\']([^"\']+)["\']', svg_content, re.IGNORECASE)
@@ -155,72 +755,271 @@ class LogoCluster:
     def get_image_signature(self, filename):
         try:
             path = os.path.join(self.logos_folder, filename)
-            with open(path, 'rb') as f:
-                file_hash = hashlib.md5(f.read()).hexdigest()
-            img = self.load_image(path)
-            img_resized = img.resize((64, 64), Image.Resampling.LANCZOS)
-            if img_resized.mode != 'RGB':
-                img_resized = img_resized.convert('RGB')
+            data = self.read_logo(filename)
+            file_hash = hashlib.md5(data).hexdigest()
+            thumbnail, original_size, real_type = self.thumbnail_from_buffer(data, path)
+            return self.signature_from_thumbnail(filename, file_hash, real_type, original_size, thumbnail)
             
-            img_array = np.array(img_resized)
-            real_type = self.detect_file_type(path)
-            ext = os.path.splitext(filename)[1].lower()
-            signature = {
-                'filename': filename,
-                'hash': file_hash,
-                'real_type': real_type,
-                'extension': ext,
-                'size': img.size,
-                'aspect_ratio': img.size[0] / max(img.size[1], 1),
-                'is_svg_like': real_type == 'svg' or ext == '.svg',
-            }
+        except Exception as e:
+            print(f"Error getting signature for {filename}: {e}")
+            return self.error_signature(filename)
+
+    def signature_from_bytes(self, filename, data, digest=None):
+        """Signature of logo bytes already in memory, e.g. straight from the crawler."""
+        try:
+            with time_limit(self.thumbnail_timeout):
+                thumbnail, original_size, real_type = self.thumbnail_from_buffer(data, filename)
+            return self.signature_from_thumbnail(filename, digest or hashlib.md5(data).hexdigest(),
+                                                 real_type, original_size, thumbnail)
+        except ThumbnailTimeout:
+            print(f"Timed out decoding {filename} after {self.thumbnail_timeout}s")
+            return self.error_signature(filename)
+        except Exception as e:
+            print(f"Error getting signature for {filename}: {e}")
+            return self.error_signature(filename)
+
+    def thumbnail_from_buffer(self, data, path):
+        """(WORKING_SIZE RGB uint8 array, original size, real_type) of an image file's bytes."""
+        real_type = self.detect_buffer_type(data, path)
+        img = self.load_image_buffer(data, real_type, path)
+        original_size = img.info.get('svg_size', img.size)
+        img_resized = self.working_image(img)
+        if img_resized.mode != 'RGB':
+            img_resized = img_resized.convert('RGB')
+        return np.array(img_resized), original_size, real_type
+
+    def file_thumbnail(self, filename):
+        """Thumbnail entry of one file for ThumbnailStore.put_many, decoded within thumbnail_timeout."""
+        try:
+            data = self.read_logo(filename)
+        except Exception as e:
+            print(f"Error getting thumbnail for {filename}: {e}")
+            return filename, (None, None, (0, 0), None)
+        return self.buffer_thumbnail(filename, data)
+
+    def buffer_thumbnail(self, filename, data, digest=None):
+        """file_thumbnail of bytes already read, e.g. while computing their digest."""
+        try:
+            digest = digest or hashlib.md5(data).hexdigest()
+            with time_limit(self.thumbnail_timeout):
+                thumbnail, original_size, real_type = self.thumbnail_from_buffer(data, filename)
+            return filename, (digest, thumbnail, original_size, real_type)
+        except ThumbnailTimeout:
+            print(f"Timed out decoding {filename} after {self.thumbnail_timeout}s")
+        except Exception as e:
+            print(f"Error getting thumbnail for {filename}: {e}")
+        return filename, (digest, None, (0, 0), None)
+
+    def signature_from_thumbnail(self, filename, file_hash, real_type, original_size, img_array):
+        ext = os.path.splitext(filename)[1].lower()
+        signature = {
+            'filename': filename,
+            'hash': file_hash,
+            'real_type': real_type,
+            'extension': ext,
+            'size': original_size,
+            'aspect_ratio': original_size[0] / max(original_size[1], 1),
+            'is_svg_like': real_type == 'svg' or ext == '.svg',
+        }
+        img_resized = Image.fromarray(np.asarray(img_array))
+        try:
+            signature['phash'] = str(imagehash.phash(img_resized))
+            signature['ahash'] = str(imagehash.average_hash(img_resized))
+        except:
+            signature['phash'] = '0' * 16  
+            signature['ahash'] = '0' * 16
+        if img_array.size > 0:
+            signature['avg_color'] = tuple(img_array.mean(axis=(0, 1)).astype(int))
+            if len(img_array.shape) == 3:
+                gray = np.dot(img_array[...,:3], [0.299, 0.587, 0.114])
+            else:
+                gray = img_array
+            
+            signature['brightness'] = float(gray.mean())
+            signature['contrast'] = float(gray.std())
+        else:
+            signature['avg_color'] = (128, 128, 128)
+            signature['brightness'] = 128
+            signature['contrast'] = 0
+        
+        return signature
+
+    def error_signature(self, filename):
+        return {
+            'filename': filename,
+            'hash': 'error',
+            'real_type': 'error',
+            'extension': os.path.splitext(filename)[1].lower(),
+            'size': (64, 64),
+            'aspect_ratio': 1.0,
+            'is_svg_like': False,
+            'phash': '0' * 16,
+            'ahash': '0' * 16,
+            'avg_color': (128, 128, 128),
+            'brightness': 128,
+            'contrast': 0
+        }
+
+    def read_logo(self, filename):
+        if self.source:
+            return self.source.read(filename)
+        with open(os.path.join(self.logos_folder, filename), 'rb') as f:
+            return f.read()
+
+    def read_digests(self, image_files):
+        """(digests, buffers) of image_files.
+
+        A parquet source already knows its digests, so nothing is read and
+        buffers is None. Otherwise each file is read once and buffers keeps its
+        bytes, so decoding it later needs no second read or hash.
+        """
+        if self.source:
+            return [self.source.digests.get(f) for f in image_files], None
+        digests, buffers = [], {}
+        for filename in image_files:
             try:
-                signature['phash'] = str(imagehash.phash(img_resized))
-                signature['ahash'] = str(imagehash.average_hash(img_resized))
-            except:
-                signature['phash'] = '0' * 16  
-                signature['ahash'] = '0' * 16
-            if img_array.size > 0:
-                signature['avg_color'] = tuple(img_array.mean(axis=(0, 1)).astype(int))
-                if len(img_array.shape) == 3:
-                    gray = np.dot(img_array[...,:3], [0.299, 0.587, 0.114])
+                data = self.read_logo(filename)
+            except OSError:
+                digests.append(None)
+                continue
+            digests.append(hashlib.md5(data).hexdigest())
+            buffers[filename] = data
+        return digests, buffers
+
+    def signature_for_file(self, stored, digest, filename):
+        ext = os.path.splitext(filename)[1].lower()
+        real_type = stored['real_type'] or (ext[1:] if ext else 'unknown')
+        signature = {
+            'filename': filename,
+            'hash': digest,
+            'real_type': real_type,
+            'extension': ext,
+            'is_svg_like': real_type == 'svg' or ext == '.svg',
+        }
+        signature.update({field: value for field, value in stored.items() if field != 'real_type'})
+        return signature
+
+    def iter_signatures(self, image_files, chunksize=32, batch_size=8192):
+        """Signatures of image_files in input order.
+
+        With a signature store only files whose content hash has no stored
+        signature are decoded (once per distinct hash); the rest are rebuilt
+        from the store. Files are looked up batch_size at a time, so memory
+        stays flat however many files there are: each signature is yielded
+        (and typically written into a SignatureMatrix row) before the next
+        batch is read. A file is read once: the bytes hashed for the lookup
+        are the ones decoded.
+        """
+        if self.signature_store is None:
+            yield from self.compute_signatures(image_files, chunksize=chunksize)
+            return
+        reused = decoded = 0
+        for start in range(0, len(image_files), batch_size):
+            files = image_files[start:start + batch_size]
+            digests, buffers = self.read_digests(files)
+            stored = self.signature_store.get_many({d for d in digests if d})
+            todo = {}
+            queued = set()
+            for filename, digest in zip(files, digests):
+                if digest is None or (digest not in stored and digest not in queued):
+                    todo[filename] = digest
+                    queued.add(digest)
+            reused += len(files) - sum(d not in stored for d in digests)
+            decoded += len(todo)
+            if buffers is not None:
+                buffers = {f: buffers[f] for f in todo if f in buffers}
+            computed = {sig['filename']: sig
+                        for sig in self.compute_signatures(list(todo), list(todo.values()), chunksize, buffers)}
+            fresh = [sig for sig in computed.values() if sig['hash'] != 'error']
+            self.signature_store.put_many(fresh)
+            stored.update((sig['hash'], SignatureStore.content_fields(sig)) for sig in fresh)
+            for filename, digest in zip(files, digests):
+                if filename in computed:
+                    yield computed[filename]
+                elif digest in stored:
+                    yield self.signature_for_file(stored[digest], digest, filename)
                 else:
-                    gray = img_array
-                
-                signature['brightness'] = float(gray.mean())
-                signature['contrast'] = float(gray.std())
+                    yield self.error_signature(filename)
+        print(f"Signature cache: {reused} reused, {decoded} distinct files decoded")
+
+    def compute_signatures(self, image_files, digests=None, chunksize=32, buffers=None):
+        """Signatures of image_files in input order.
+
+        With a thumbnail store, signatures are computed from the stored
+        thumbnails, decoding only files whose content hash has none yet;
+        otherwise each file is decoded by get_image_signature. buffers (from
+        read_digests, with digests) holds bytes already read, which are
+        decoded instead of reading the files again.
+        """
+        if self.thumbnail_store is None:
+            if buffers is None:
+                yield from self.map_files(_signature_worker, self.get_image_signature, image_files, chunksize)
             else:
-                signature['avg_color'] = (128, 128, 128)
-                signature['brightness'] = 128
-                signature['contrast'] = 0
-            
-            return signature
-            
-        except Exception as e:
-            print(f"Error getting signature for {filename}: {e}")
-            return {
-                'filename': filename,
-                'hash': 'error',
-                'real_type': 'error',
-                'extension': os.path.splitext(filename)[1].lower(),
-                'size': (64, 64),
-                'aspect_ratio': 1.0,
-                'is_svg_like': False,
-                'phash': '0' * 16,
-                'ahash': '0' * 16,
-                'avg_color': (128, 128, 128),
-                'brightness': 128,
-                'contrast': 0
-            }
-    
+                yield from self.map_files(_bytes_signature_worker, self.signature_from_bytes, image_files, chunksize,
+                                          [buffers.get(f) for f in image_files], digests)
+            return
+        if digests is None:
+            digests, buffers = self.read_digests(image_files)
+        entries = self.build_thumbnails(image_files, digests, chunksize, buffers)
+        thumbnails = self.thumbnail_store.view()
+        for filename, digest in zip(image_files, digests):
+            entry = entries.get(digest)
+            if entry is None or entry[0] < 0:
+                yield self.error_signature(filename)
+                continue
+            row, original_size, real_type = entry
+            ext = os.path.splitext(filename)[1].lower()
+            real_type = real_type or (ext[1:] if ext else 'unknown')
+            yield self.signature_from_thumbnail(filename, digest, real_type, original_size, thumbnails[row])
+
+    def build_thumbnails(self, image_files, digests, chunksize=32, buffers=None):
+        """Decode missing thumbnails (one file per content hash) into the store; returns their entries.
+
+        Files in buffers are decoded from those bytes instead of being read again.
+        """
+        entries = self.thumbnail_store.get_many({d for d in digests if d})
+        todo = {}
+        for filename, digest in zip(image_files, digests):
+            if digest and digest not in entries:
+                todo.setdefault(digest, filename)
+        if todo:
+            print(f"Decoding {len(todo)} thumbnails into {self.thumbnail_store.path}")
+            decoded = []
+            files = list(todo.values())
+            if buffers is None:
+                results = self.map_files(_thumbnail_worker, self.file_thumbnail, files, chunksize)
+            else:
+                results = self.map_files(_buffer_thumbnail_worker, self.buffer_thumbnail, files, chunksize,
+                                                 [buffers[f] for f in files], list(todo))
+            for i, (filename, entry) in enumerate(results):
+                if entry[0]:
+                    decoded.append(entry)
+                if (i + 1) % 1000 == 0:
+                    print(f"  Decoded {i + 1}/{len(todo)} thumbnails")
+            entries.update(self.thumbnail_store.put_many(decoded))
+        return entries
+
+    def map_files(self, worker, local, image_files, chunksize=32, *columns):
+        """local(f, ...) for each file in input order, or worker(f, ...) on self.workers processes.
+
+        columns are further per-file argument lists, as for map().
+        """
+        if self.workers <= 1 or len(image_files) < 2 * chunksize:
+            yield from map(local, image_files, *columns)
+            return
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_signature_worker,
+                                 initargs=(self.logos_folder, self.thumbnail_timeout)) as executor:
+            yield from executor.map(worker, image_files, *columns, chunksize=chunksize)
+
     def compare_signatures(self, sig1, sig2):
         if not sig1 or not sig2:
             return 0.0
         cache_key = (sig1['filename'], sig2['filename'])
         if cache_key in self.cache:
+            self.cache.move_to_end(cache_key)
             return self.cache[cache_key]
         if sig1['hash'] != 'error' and sig2['hash'] != 'error' and sig1['hash'] == sig2['hash']:
-            self.cache[cache_key] = 1.0
+            self.remember(cache_key, 1.0)
             return 1.0
         
         similarity_scores = []
@@ -258,23 +1057,184 @@ class LogoCluster:
         else:
             similarity = sum(s * w for s, w in zip(similarity_scores, weights)) / total_weight
         
-        self.cache[cache_key] = similarity
+        self.remember(cache_key, similarity)
         return similarity
+
+    def remember(self, cache_key, similarity):
+        self.cache[cache_key] = similarity
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
     
     def cluster_logos(self, image_files):
+        if self.engine == 'blocked' and self.work_dir is None:
+            with tempfile.TemporaryDirectory(prefix='logo_cluster_') as work_dir:
+                self.work_dir = work_dir
+                try:
+                    return self.cluster_logos(image_files)
+                finally:
+                    self.work_dir = None
         print("Clustering logos...")
-        signatures = {}
-        valid_files = []
+        signatures = {} if self.engine == 'pairwise' else None
+        valid_files = list(image_files)
         print("Extracting signatures...")
-        for i, filename in enumerate(image_files):
-            signature = self.get_image_signature(filename)
-            signatures[filename] = signature
-            valid_files.append(filename)
-            
-            if (i + 1) % 100 == 0:
-                print(f"  Processed {i + 1}/{len(image_files)} files")
+
+        def progress(stream):
+            for i, signature in enumerate(stream):
+                if signatures is not None:
+                    signatures[signature['filename']] = signature
+                if (i + 1) % 100 == 0:
+                    print(f"  Processed {i + 1}/{len(image_files)} files")
+                yield signature
+
+        folder = self.work_dir if self.engine == 'blocked' else None
+        matrix = SignatureMatrix(progress(self.iter_signatures(valid_files)), size=len(valid_files),
+                                 folder=folder and self.work_dir_for('signatures'))
         
         print(f"Got signatures for {len(valid_files)} logos")
+        duplicates = self.collapse_duplicates(matrix)
+        representatives = [members[0] for members in duplicates]
+        rep_files = [valid_files[i] for i in representatives]
+        print(f"Collapsed {len(valid_files)} logos into {len(rep_files)} distinct files")
+        if self.engine == 'pairwise':
+            groups = self.greedy_groups_pairwise(rep_files, signatures)
+        elif self.engine == 'indexed':
+            groups = self.greedy_groups_indexed(rep_files, matrix.take(representatives))
+        elif self.engine == 'blocked':
+            groups = self.greedy_groups_blocked(
+                rep_files, matrix.take(np.array(representatives), folder=self.work_dir_for('representatives')))
+        else:
+            groups = self.greedy_groups_vectorized(rep_files, matrix.take(representatives))
+        print("Checking for exact duplicates...")
+        # Copies always land in the greedy group of their first occurrence, so
+        # grouping the representatives gives the groups of the full pass minus
+        # the copies. Exact groups take precedence: a similarity group holding
+        # any duplicated file is dropped and its other members become unique.
+        exact_groups = []
+        processed = set()
+        for members in duplicates:
+            if len(members) > 1:
+                files = [valid_files[i] for i in members]
+                exact_groups.append({
+                    'type': 'exact',
+                    'files': files,
+                    'count': len(files),
+                    'avg_similarity': 1.0
+                })
+                processed.add(files[0])
+        other_groups = [group for group in groups if processed.isdisjoint(group['files'])]
+        processed.update(f for group in other_groups for f in group['files'])
+        for file in rep_files:
+            if file not in processed:
+                other_groups.append({
+                    'type': 'unique',
+                    'files': [file],
+                    'count': 1,
+                    'avg_similarity': 1.0
+                })
+        final_groups = exact_groups + other_groups
+        
+        print(f"Created {len(final_groups)} total groups")
+        print(f"ll {len(valid_files)} logos are in groups")
+        
+        return final_groups
+    
+    def collapse_duplicates(self, matrix):
+        """Row ids grouped by content hash, first occurrence first; failed signatures stay alone."""
+        duplicates = {}
+        for i, code in enumerate(matrix.hash_code.tolist()):
+            duplicates.setdefault(code if code >= 0 else ('error', i), []).append(i)
+        return list(duplicates.values())
+
+    def update_groups(self, image_files, groups_file="logo_gorups.json"):
+        """Extend the groups saved in groups_file instead of reclustering.
+
+        Files that are gone are dropped from their groups; groups that are
+        left unchanged are returned as saved. Each new file joins the group
+        whose representative (first file) scores highest, if that score is at
+        least 0.7, otherwise it starts a new group. Returns (groups, names).
+        """
+        with open(groups_file) as f:
+            saved = json.load(f)['groups']
+        current = set(image_files)
+        saved_files = sum(len(group['files']) for group in saved.values())
+        names, groups, changed = [], [], set()
+        for name, group in saved.items():
+            files = [f for f in group['files'] if f in current]
+            if not files:
+                continue
+            if len(files) != len(group['files']):
+                group['files'] = files
+                changed.add(len(groups))
+            names.append(name)
+            groups.append(group)
+        known = {f for group in groups for f in group['files']}
+        new_files = [f for f in image_files if f not in known]
+        removed = saved_files - len(known)
+        print(f"Incremental update: {len(groups)} groups kept, {len(new_files)} new logos, {removed} removed")
+
+        representatives = [group['files'][0] for group in groups]
+        matrix = SignatureMatrix(self.iter_signatures(representatives + new_files),
+                                 size=len(representatives) + len(new_files))
+        rep_rows = list(range(len(representatives)))
+        next_number = max((int(m.group(1)) for m in (re.search(r'(\d+)$', n) for n in names) if m), default=0) + 1
+        for k, filename in enumerate(new_files):
+            row = len(representatives) + k
+            best = -1
+            if rep_rows:
+                similarities = matrix.similarity(row, np.array(rep_rows))
+                best = int(np.argmax(similarities))
+                if similarities[best] < 0.7:
+                    best = -1
+            if best < 0:
+                rep_rows.append(row)
+                names.append(f"group_{next_number:04d}")
+                next_number += 1
+                groups.append({'type': 'unique', 'files': [filename], 'count': 1, 'avg_similarity': 1.0})
+            else:
+                groups[best]['files'].append(filename)
+                changed.add(best)
+        self.refresh_groups([groups[i] for i in sorted(changed)])
+        return groups, names
+
+    def refresh_groups(self, groups):
+        """Recompute type, count and avg_similarity (between distinct files) of groups."""
+        files = [f for group in groups for f in group['files']]
+        if not files:
+            return
+        matrix = SignatureMatrix(self.iter_signatures(files), size=len(files))
+        start = 0
+        for group in groups:
+            self.describe_group(group, matrix, list(range(start, start + len(group['files']))))
+            start += len(group['files'])
+
+    def describe_group(self, group, matrix, rows):
+        """Set type, count and avg_similarity (between distinct files) of group from its matrix rows."""
+        distinct = [rows[members[0]] for members in self.collapse_duplicates(matrix.take(rows))]
+        group['count'] = len(group['files'])
+        if group['count'] == 1:
+            group['type'], group['avg_similarity'] = 'unique', 1.0
+        elif len(distinct) == 1:
+            group['type'], group['avg_similarity'] = 'exact', 1.0
+        else:
+            group['type'] = 'similar'
+            group['avg_similarity'] = self.matrix_group_similarity(matrix, distinct)
+
+    def make_group(self, current_group, avg_similarity):
+        if len(current_group) > 1:
+            return {
+                'type': 'similar',
+                'files': current_group,
+                'count': len(current_group),
+                'avg_similarity': avg_similarity()
+            }
+        return {
+            'type': 'unique',
+            'files': current_group,
+            'count': 1,
+            'avg_similarity': 1.0
+        }
+
+    def greedy_groups_pairwise(self, valid_files, signatures):
         groups = []
         assigned = set()
         for i, file1 in enumerate(valid_files):
@@ -292,60 +1252,128 @@ class LogoCluster:
                 if similarity >= 0.7:
                     current_group.append(file2)
                     assigned.add(file2)
-            if len(current_group) > 1:
-                groups.append({
-                    'type': 'similar',
-                    'files': current_group,
-                    'count': len(current_group),
-                    'avg_similarity': self.calculate_group_similarity(current_group, signatures)
-                })
-            else:
-                groups.append({
-                    'type': 'unique',
-                    'files': current_group,
-                    'count': 1,
-                    'avg_similarity': 1.0
-                })
+            groups.append(self.make_group(
+                current_group, lambda: self.calculate_group_similarity(current_group, signatures)))
             
             if len(groups) % 50 == 0:
                 print(f"  Created {len(groups)} groups, processed {len(assigned)}/{len(valid_files)} logos")
-        print("Checking for exact duplicates...")
-        hash_groups = defaultdict(list)
-        for filename, sig in signatures.items():
-            if sig['hash'] != 'error':
-                hash_groups[sig['hash']].append(filename)
-        final_groups = []
-        processed = set()
-        
-        for files in hash_groups.values():
-            if len(files) > 1 and all(f not in processed for f in files):
-                final_groups.append({
-                    'type': 'exact',
-                    'files': files,
-                    'count': len(files),
-                    'avg_similarity': 1.0
-                })
-                processed.update(files)
-        for group in groups:
-            group_files = set(group['files'])
-            if not group_files.intersection(processed):
-                final_groups.append(group)
-                processed.update(group_files)
-        all_files_set = set(valid_files)
-        remaining = all_files_set - processed
-        for file in remaining:
-            final_groups.append({
-                'type': 'unique',
-                'files': [file],
-                'count': 1,
-                'avg_similarity': 1.0
-            })
-        
-        print(f"Created {len(final_groups)} total groups")
-        print(f"ll {len(valid_files)} logos are in groups")
-        
-        return final_groups
-    
+        return groups
+
+    def greedy_groups_vectorized(self, valid_files, matrix):
+        """Same greedy pass as greedy_groups_pairwise, one NumPy row per seed logo."""
+        groups = []
+        assigned = np.zeros(len(valid_files), dtype=bool)
+        for i in range(len(valid_files)):
+            if assigned[i]:
+                continue
+            assigned[i] = True
+            candidates = np.flatnonzero(~assigned[i + 1:]) + i + 1
+            members = candidates[matrix.similarity(i, candidates) >= 0.7]
+            assigned[members] = True
+            indices = [i] + members.tolist()
+            groups.append(self.make_group(
+                [valid_files[k] for k in indices], lambda: self.matrix_group_similarity(matrix, indices)))
+
+            if len(groups) % 50 == 0:
+                print(f"  Created {len(groups)} groups, processed {int(assigned.sum())}/{len(valid_files)} logos")
+        return groups
+
+    def greedy_groups_indexed(self, valid_files, matrix):
+        """Greedy pass that only scores pairs proposed by a CandidateIndex.
+
+        Pairs whose pHash and aHash are both further apart than hash_radius
+        are never compared; the printed recall is the share of >= 0.7 pairs
+        (on a sample of logos) that the index still proposes, with a warning
+        below MIN_INDEX_RECALL.
+        """
+        start = time.time()
+        index = CandidateIndex(matrix, radius=self.hash_radius, bands=self.hash_bands)
+        recall = index.recall(matrix)
+        print(f"Candidate index: {index.pair_count()} pairs within Hamming radius {self.hash_radius} "
+              f"({time.time() - start:.2f}s), recall vs exhaustive {recall * 100:.1f}%")
+        if recall < MIN_INDEX_RECALL:
+            print(f"Warning: the candidate index misses {(1 - recall) * 100:.1f}% of similar pairs, so groups "
+                  f"will differ from engine='vectorized'; raise hash_radius or use an exhaustive engine")
+        groups = []
+        assigned = np.zeros(len(valid_files), dtype=bool)
+        for i in range(len(valid_files)):
+            if assigned[i]:
+                continue
+            assigned[i] = True
+            candidates = index.neighbors(i)
+            candidates = candidates[candidates > i]
+            candidates = candidates[~assigned[candidates]]
+            members = candidates[matrix.similarity(i, candidates) >= 0.7]
+            assigned[members] = True
+            indices = [i] + members.tolist()
+            groups.append(self.make_group(
+                [valid_files[k] for k in indices], lambda: self.matrix_group_similarity(matrix, indices)))
+
+            if len(groups) % 50 == 0:
+                print(f"  Created {len(groups)} groups, processed {int(assigned.sum())}/{len(valid_files)} logos")
+        return groups
+
+    def greedy_groups_blocked(self, valid_files, matrix):
+        """Same groups as greedy_groups_vectorized, block_size rows at a time.
+
+        matrix may be memory-mapped; only two blocks of rows are loaded at
+        once. Seeds of a block are resolved greedily inside the block, then
+        each still unassigned row of every later block goes to the first of
+        those seeds that matches it. Row labels (seed ids) live in work_dir.
+        """
+        n = len(valid_files)
+        labels = allocate_column(self.work_dir_for('labels'), 'labels', (n,), np.int64)
+        labels[:] = -1
+        for start in range(0, n, self.block_size):
+            rows = np.arange(start, min(start + self.block_size, n))
+            rows = rows[labels[rows] < 0]
+            if not len(rows):
+                continue
+            block = matrix.take(rows)
+            local = np.full(len(rows), -1)
+            for k in range(len(rows)):
+                if local[k] >= 0:
+                    continue
+                local[k] = k
+                candidates = np.flatnonzero(local[k + 1:] < 0) + k + 1
+                local[candidates[block.similarity(k, candidates) >= 0.7]] = k
+            labels[rows] = rows[local]
+            seeds = np.flatnonzero(local == np.arange(len(rows)))
+            seed_rows = rows[seeds]
+            for target_start in range(rows[-1] + 1, n, self.block_size):
+                targets = np.arange(target_start, min(target_start + self.block_size, n))
+                targets = targets[labels[targets] < 0]
+                if not len(targets):
+                    continue
+                pair = matrix.take(np.concatenate([seed_rows, targets]))
+                matches = pair.similarity(np.arange(len(seed_rows))[:, None],
+                                          np.arange(len(seed_rows), len(pair))) >= 0.7
+                matched = matches.any(axis=0)
+                labels[targets[matched]] = seed_rows[matches.argmax(axis=0)[matched]]
+            print(f"  Block {start // self.block_size + 1}/{-(-n // self.block_size)}: "
+                  f"{len(seeds)} new groups, {int((labels[:] >= 0).sum())}/{n} logos assigned")
+
+        groups = []
+        order = np.argsort(labels, kind='stable')
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        for members in np.split(order, bounds):
+            indices = members.tolist()
+            groups.append(self.make_group(
+                [valid_files[k] for k in indices],
+                lambda: self.matrix_group_similarity(matrix.take(members), range(len(indices)))))
+        return groups
+
+    def work_dir_for(self, name):
+        path = os.path.join(self.work_dir, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def matrix_group_similarity(self, matrix, indices):
+        indices = np.asarray(indices)
+        similarities = np.concatenate([matrix.similarity(indices[k], indices[k + 1:])
+                                       for k in range(len(indices) - 1)])
+        return np.mean(similarities) if len(similarities) else 0.0
+
     def calculate_group_similarity(self, files, signatures):
         if len(files) <= 1:
             return 1.0
@@ -360,7 +1388,7 @@ class LogoCluster:
         
         return np.mean(similarities) if similarities else 0.0
     
-    def analyze_and_save(self, groups, total_files):
+    def analyze_and_save(self, groups, total_files, group_names=None):
         print("\nANALYSIS RESULTS")
         
         total_groups = len(groups)
@@ -409,7 +1437,7 @@ class LogoCluster:
         }
         
         for i, group in enumerate(groups):
-            group_name = f"group_{i+1:04d}"
+            group_name = group_names[i] if group_names else f"group_{i+1:04d}"
             output['groups'][group_name] = group
         
         with open('logo_gorups.json', 'w') as f:
@@ -460,17 +1488,21 @@ class LogoCluster:
 
 if __name__ == "__main__":
     start_time = time.time()
-    if not os.path.exists("LOGOS"):
+    logos_source = "LOGOS_PARQUET" if os.path.exists("LOGOS_PARQUET") else "LOGOS"
+    if not os.path.exists(logos_source):
         print("ERROR: LOGOS folder not found!")
         exit(1)
-    clusterer = LogoCluster("LOGOS")
+    clusterer = LogoCluster(logos_source)
     image_files = clusterer.load_all_images()
     
     if not image_files:
         print("No image files found!")
         exit(1)
     print(f"\nProcessing {len(image_files)} files...")
-    groups = clusterer.cluster_logos(image_files)
-    results = clusterer.analyze_and_save(groups, len(image_files))
+    if '--incremental' in sys.argv[1:] and os.path.exists('logo_gorups.json'):
+        groups, group_names = clusterer.update_groups(image_files)
+    else:
+        groups, group_names = clusterer.cluster_logos(image_files), None
+    results = clusterer.analyze_and_save(groups, len(image_files), group_names)
     
     total_time = time.time() - start_time
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""Streaming crawl -> signature -> cluster run.
+
+oa.py and oa2.py normally run one after the other: the whole crawl is written
+to LOGOS/ before clustering starts re-reading it. Here each logo found by the
+crawler goes straight, as in-memory bytes with the md5 the crawler already
+computed, through a bounded queue to the signature workers and on to
+OnlineClusterer, so the run takes about as long as its slowest stage.
+
+    python pipeline.py --backend asyncio --signature-workers 4 --queue-size 256
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import oa
+import oa2
+
+
+DONE = object()
+
+
+class StageQueue(queue.Queue):
+    """Bounded queue between two stages that records how long producers waited on it.
+
+    A producer blocked on a full queue means the consumer is the bottleneck;
+    a consumer starved on an empty one means the producer is.
+    """
+
+    def __init__(self, name, maxsize):
+        super().__init__(maxsize)
+        self.name = name
+        self.items = 0
+        self.peak = 0
+        self.put_blocked = 0.0
+        self.get_starved = 0.0
+
+    def put(self, item, block=True, timeout=None):
+        start = time.perf_counter()
+        super().put(item, block, timeout)
+        with self.mutex:
+            self.put_blocked += time.perf_counter() - start
+            if item is not DONE:
+                self.items += 1
+            self.peak = max(self.peak, self._qsize())
+
+    def get(self, block=True, timeout=None):
+        start = time.perf_counter()
+        item = super().get(block, timeout)
+        with self.mutex:
+            self.get_starved += time.perf_counter() - start
+        return item
+
+    def report(self):
+        return (f"{self.name}: {self.qsize()}/{self.maxsize} queued, peak {self.peak}, "
+                f"{self.items:,} passed, producer blocked {self.put_blocked:.1f}s, "
+                f"consumer starved {self.get_starved:.1f}s")
+
+
+def fetch_stage(urls, logos, args, outcome, metrics=None):
+    """Crawl urls, putting (filename, bytes, digest) of every logo on logos.
+
+    URLs already in the journal are replayed first so a resumed run still
+    clusters them. Filenames match save_all_in_single_folder/save_parquet_shards.
+    """
+    positions = {}
+    for i, url in enumerate(urls, 1):
+        positions.setdefault(url, []).append(i)
+
+    def enqueue(url, entry):
+        data = entry.get('bytes')
+        if not data:
+            return
+        digest = entry.get('digest') or oa.logo_digest(data)
+        for i in positions.get(url, ()):
+            logos.put((f"{i:04d}.{oa.logo_extension(data)}", data, digest))
+
+    try:
+        journal = oa.CrawlJournal(args.journal)
+        try:
+            done = journal.keys()
+            replay = [url for url in positions if url in done]
+            if replay:
+                print(f"Replaying {len(replay):,} URLs already in {args.journal}")
+            for url in replay:
+                enqueue(url, journal[url])
+        finally:
+            journal.close()
+        outcome['results'], outcome['stats'] = oa.process_all_urls(
+            urls, max_workers=args.workers, backend=args.backend, max_concurrency=args.concurrency,
+            journal_file=args.journal, on_result=enqueue, hunter_options={'metrics': metrics},
+            metrics_file=args.metrics_file or None, metrics_interval=args.report_interval)
+    except BaseException as e:
+        outcome['error'] = e
+    finally:
+        logos.put(DONE)
+
+
+def completed(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def signature_stage(logos, signatures, args, outcome):
+    """Turn queued logo bytes into signatures, in arrival order.
+
+    Digests with a stored signature skip decoding; the rest go to
+    signature_workers processes with at most queue_size in flight. With a
+    single worker they are decoded in this thread, without thumbnail_timeout
+    (time_limit needs the main thread).
+    """
+    cluster = oa2.LogoCluster(None, signature_cache=None, thumbnail_cache=None,
+                              thumbnail_timeout=args.thumbnail_timeout)
+    store = oa2.SignatureStore(args.signature_cache) if args.signature_cache else None
+    executor = None
+    if args.signature_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.signature_workers,
+                                       initializer=oa2._init_signature_worker,
+                                       initargs=(None, args.thumbnail_timeout))
+    known = {}
+    fresh = []
+    pending = deque()
+
+    def emit(limit):
+        while pending and (len(pending) > limit or pending[0][1].done()):
+            filename, future = pending.popleft()
+            try:
+                signature = future.result()
+            except Exception as e:
+                print(f"Error getting signature for {filename}: {e}")
+                signature = cluster.error_signature(filename)
+            if signature['hash'] != 'error' and signature['hash'] not in known:
+                known[signature['hash']] = oa2.SignatureStore.content_fields(signature)
+                fresh.append(signature)
+            signatures.put(signature)
+        if store is not None and len(fresh) >= 256:
+            store.put_many(fresh)
+            fresh.clear()
+
+    item = None
+    try:
+        while True:
+            item = logos.get()
+            if item is DONE:
+                break
+            filename, data, digest = item
+            if digest not in known and store is not None:
+                known.update(store.get_many({digest}))
+            if digest in known:
+                future = completed(cluster.signature_for_file(known[digest], digest, filename))
+            elif executor is not None:
+                future = executor.submit(oa2._bytes_signature_worker, filename, data, digest)
+            else:
+                future = completed(cluster.signature_from_bytes(filename, data, digest))
+            pending.append((filename, future))
+            emit(args.queue_size)
+        emit(0)
+    except BaseException as e:
+        outcome['error'] = e
+        while item is not DONE:
+            item = logos.get()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if store is not None:
+            store.put_many(fresh)
+            store.close()
+        signatures.put(DONE)
+
+
+def monitor(queues, clusterer, stop, interval):
+    while not stop.wait(interval):
+        print(f"\n[pipeline] {len(clusterer):,} logos clustered into {len(clusterer.members):,} groups")
+        for q in queues:
+            print(f"[pipeline]   {q.report()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl, fingerprint and cluster logos in one streaming run")
+    parser.add_argument('--urls', default='logos.snappy.parquet', help="parquet file of site URLs")
+    parser.add_argument('--limit', type=int, default=None, help="only the first N URLs")
+    parser.add_argument('--backend', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--workers', type=int, default=50, help="crawler threads (threads backend)")
+    parser.add_argument('--concurrency', type=int, default=500, help="crawler requests in flight (asyncio backend)")
+    parser.add_argument('--signature-workers', type=int, default=os.cpu_count() or 1,
+                        help="signature processes; 1 computes in the signature thread, "
+                             "where --thumbnail-timeout does not apply")
+    parser.add_argument('--queue-size', type=int, default=256,
+                        help="bound of each stage queue and of signatures in flight")
+    parser.add_argument('--thumbnail-timeout', type=float, default=10)
+    parser.add_argument('--journal', default='crawl_journal.sqlite')
+    parser.add_argument('--signature-cache', default='signature_cache.sqlite', help="'' to disable")
+    parser.add_argument('--save', choices=['parquet', 'folder', 'none'], default='parquet',
+                        help="also write the crawled logos as LOGOS_PARQUET shards or a LOGOS folder")
+    parser.add_argument('--report-interval', type=float, default=10,
+                        help="seconds between queue reports and metrics refreshes")
+    parser.add_argument('--metrics-file', default='crawl_metrics.prom',
+                        help="crawler and queue metrics, Prometheus text or .json; '' to disable")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    urls = oa.load_urls(args.urls)[:args.limit]
+    logos = StageQueue('fetch -> signature', args.queue_size)
+    signatures = StageQueue('signature -> cluster', args.queue_size)
+    clusterer = oa2.OnlineClusterer()
+    outcome = {}
+    stop = threading.Event()
+    metrics = oa.CrawlMetrics()
+    for q in (logos, signatures):
+        metrics.gauge_callback('pipeline_queue_depth', q.qsize, queue=q.name)
+        metrics.gauge_callback('pipeline_queue_put_blocked_seconds', lambda q=q: q.put_blocked, queue=q.name)
+        metrics.gauge_callback('pipeline_queue_get_starved_seconds', lambda q=q: q.get_starved, queue=q.name)
+    metrics.gauge_callback('pipeline_logos_clustered', lambda: len(clusterer))
+
+    stages = [threading.Thread(target=fetch_stage, args=(urls, logos, args, outcome, metrics), name='fetch'),
+              threading.Thread(target=signature_stage, args=(logos, signatures, args, outcome), name='signature'),
+              threading.Thread(target=monitor, args=([logos, signatures], clusterer, stop, args.report_interval),
+                               name='monitor', daemon=True)]
+    for stage in stages:
+        stage.start()
+    while True:
+        signature = signatures.get()
+        if signature is DONE:
+            break
+        clusterer.add(signature)
+    stop.set()
+    for stage in stages[:2]:
+        stage.join()
+    if 'error' in outcome:
+        raise outcome['error']
+
+    print(f"\nPipeline finished in {time.time() - start_time:.1f}s")
+    for q in (logos, signatures):
+        print(f"  {q.report()}")
+
+    if args.save == 'parquet':
+        oa.save_parquet_shards(outcome['results'], urls, 'LOGOS_PARQUET')
+    elif args.save == 'folder':
+        oa.save_all_in_single_folder(outcome['results'], urls, 'LOGOS')
+    groups = clusterer.groups()
+    clusterer.cluster.analyze_and_save(groups, len(clusterer))
+    print(f"\nTotal time: {time.time() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()